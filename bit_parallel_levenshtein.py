@@ -0,0 +1,115 @@
+# This script was originaly created as part of the works on the creation of the CORAA dataset,
+# created to assist the training of portuguese automatic speech recognition tools
+
+# This is an implementation of the Levenshtein distance using the bit-parallel algorithm by
+# Myers ("A fast bit-vector algorithm for approximate string matching based on dynamic programming", 1999),
+# in the formulation for edit distance given by Hyyrö ("Explaining and extending the bit-parallel
+# approximate string matching algorithm of Myers", 2001).
+# Each column of the dynamic programming table is kept as bit vectors (python ints, so there is no limit
+# on the length of the sequences), which makes the cost O(n * m/w) instead of the O(n * m) cells of the
+# usual table.
+# It works with strings and with any other sequence of hashable items (e.g. lists of word ids).
+# The normalized similarity gives the same values as textdistance.levenshtein.normalized_similarity
+
+
+
+# levenshtein_distance
+# Calculates the Levenshtein distance between two sequences
+# RECEIVES: two sequences and, optionally, the maximum distance of interest. When it is given, the
+# calculation stops as soon as the distance is known to be larger than it
+# RETURNS: the distance, or max_distance + 1 if the distance is larger than max_distance
+def levenshtein_distance(s1, s2, max_distance=None):
+
+    # the longer sequence becomes the bit vector and the shorter one is iterated,
+    # so the loop runs as few times as possible
+    if(len(s1) < len(s2)):
+        s1, s2 = s2, s1
+
+    if(max_distance != None and len(s1) - len(s2) > max_distance):
+        return max_distance + 1
+
+    # common prefix and suffix don't change the distance
+    start = 0
+    while(start < len(s2) and s1[start] == s2[start]):
+        start += 1
+    end = 0
+    while(end < len(s2) - start and s1[len(s1) - 1 - end] == s2[len(s2) - 1 - end]):
+        end += 1
+    s1 = s1[start:len(s1) - end]
+    s2 = s2[start:len(s2) - end]
+
+    m = len(s1)
+    n = len(s2)
+
+    if(n == 0):
+        return m if max_distance == None or m <= max_distance else max_distance + 1
+
+    # Peq, for each item, the positions where it occurs in s1
+    peq = {}
+    for i, item in enumerate(s1):
+        peq[item] = peq.get(item, 0) | (1 << i)
+
+    mask = (1 << m) - 1
+    last = 1 << (m - 1)
+    vp = mask           # vertical positive deltas
+    vn = 0              # vertical negative deltas
+    score = m           # distance between s1 and the part of s2 seen so far
+
+    for j, item in enumerate(s2):
+
+        eq = peq.get(item, 0)
+        d0 = (((eq & vp) + vp) ^ vp) | eq | vn
+        hp = vn | ~(d0 | vp)
+        hn = vp & d0
+
+        if(hp & last):
+            score += 1
+        elif(hn & last):
+            score -= 1
+
+        # each remaining item can lower the distance by one at most
+        if(max_distance != None and score - (n - 1 - j) > max_distance):
+            return max_distance + 1
+
+        hp = (hp << 1) | 1
+        hn = hn << 1
+        vp = (hn | ~(d0 | hp)) & mask
+        vn = hp & d0 & mask
+
+    return score
+
+
+
+# normalized_similarity
+# Calculates the Levenshtein similarity of two sequences, normalized by the length of the longest one
+# RECEIVES: two sequences and, optionally, the minimum similarity of interest. When it is given, the
+# calculation stops as soon as the similarity is known to be lower than it
+# RETURNS: the similarity (between 0 and 1), or 0 if it is lower than min_similarity
+def normalized_similarity(s1, s2, min_similarity=None):
+
+    maximum = max(len(s1), len(s2))
+    if(maximum == 0):
+        return 1
+
+    max_distance = None
+    if(min_similarity != None):
+        # the small margin keeps rounding from excluding a pair exactly at min_similarity,
+        # which is checked exactly below
+        max_distance = int((1 - min_similarity) * maximum + 1e-9)
+
+    distance = levenshtein_distance(s1, s2, max_distance)
+    similarity = 1 - distance / maximum
+
+    if(min_similarity != None and similarity < min_similarity):
+        return 0
+    return similarity
+
+
+
+# batch_normalized_similarity
+# Calculates the normalized similarity of many pairs of sequences
+# RECEIVES: an iterable of (sequence, sequence) pairs and, optionally, the minimum similarity of interest
+# RETURNS: a list with the similarity of each pair (0 for the ones lower than min_similarity)
+def batch_normalized_similarity(pairs, min_similarity=None):
+
+    return [normalized_similarity(s1, s2, min_similarity) for s1, s2 in pairs]
@@ -0,0 +1,244 @@
+import csv
+import io
+import sys
+import numpy as np
+
+
+# This script was originaly created as part of the works on the creation of the CORAA dataset,
+# created to assist the training of portuguese automatic speech recognition tools
+
+# This is the csv reader shared by the scripts (exports, vote files, ...). Fields are parsed as real csv,
+# so quoted fields may contain the delimiter (e.g. transcriptions with commas). Only the columns asked for
+# are kept, each one returned as a typed NumPy array (int64, float64, or object for text), either for the
+# whole file or in chunks, so files bigger than memory can be read.
+# When pyarrow is installed, files are parsed by its multi-threaded csv reader; otherwise the standard "csv"
+# module is used, with the same results
+#
+# Columns are given by index (0 is the first column) or, for files with a header line, also by name.
+# A source is the path of a file (".gz" files are decompressed), "-" for the standard input, or an open file
+
+default_chunk_size = 1 << 24    # approximate number of bytes of each chunk
+
+
+
+# parse_line
+# RECEIVES: one line of a csv file and its delimiter
+# RETURNS: the list of fields of the line
+def parse_line(line, delimiter=','):
+
+    return next(csv.reader([line.rstrip('\r\n')], delimiter=delimiter), [])
+
+
+
+# read_columns
+# Reads some columns of a csv file
+# RECEIVES: the source (see above), the list of columns to be read, the delimiter, whether the first line
+# is a header and, optionally, a dict with the dtype of some of the columns (inferred otherwise)
+# RETURNS: a list with one array per column, in the order of "columns"
+def read_columns(source, columns, delimiter=',', header=False, types=None):
+
+    chunks = list(iter_columns(source, columns, delimiter, header, types))
+    if(len(chunks) == 0):
+        return [np.empty(0, dtype=(types or {}).get(column, object)) for column in columns]
+
+    return [np.concatenate([chunk[i] for chunk in chunks]) for i in range(len(columns))]
+
+
+
+# iter_columns
+# Reads some columns of a csv file in chunks of about "chunk_size" bytes
+# RECEIVES: the same as "read_columns", and the size of the chunks
+# RETURNS: a generator of lists with one array per column (the rows of the chunk), in the order of "columns"
+def iter_columns(source, columns, delimiter=',', header=False, types=None, chunk_size=default_chunk_size):
+
+    types = types or {}
+
+    with open_source(source) as f:
+        try:
+            import pyarrow.csv
+        except ImportError:
+            yield from __iter_columns_csv(f, columns, delimiter, header, types, chunk_size)
+            return
+
+        # pyarrow can't read rows with a different number of fields than the first one (e.g. the old exports,
+        # with unquoted commas in the transcriptions), which the csv module reads as any other row. When one is
+        # found, the rest of the file is read by the csv module, from the first row not given yet, so the file is
+        # read again from its start: sources that can't be (e.g. the standard input) are copied to a temporary
+        # file first
+        if(not f.seekable()):
+            f = __spool(f)
+        start = f.tell()
+
+        rows = 0
+        try:
+            for arrays in __iter_columns_arrow(f, columns, delimiter, header, types, chunk_size):
+                rows += len(arrays[0])
+                yield arrays
+        except __RaggedRow:
+            f.seek(start)
+            yield from __iter_columns_csv(f, columns, delimiter, header, types, chunk_size, skip=rows)
+
+
+
+# open_source
+# RECEIVES: a source (see above)
+# RETURNS: a context manager that gives a binary file object
+def open_source(source):
+
+    if(source == '-'):
+        return __NotClosing(sys.stdin.buffer)
+    if(isinstance(source, str)):
+        if(source.endswith('.gz')):
+            import gzip
+            return gzip.open(source, 'rb')
+        return open(source, 'rb')
+
+    # open files: text files are read through their underlying binary buffer
+    return __NotClosing(getattr(source, 'buffer', source))
+
+
+
+def __spool(f):
+
+    import shutil
+    import tempfile
+
+    spooled = tempfile.SpooledTemporaryFile(max_size=default_chunk_size)
+    shutil.copyfileobj(f, spooled)
+    spooled.seek(0)
+
+    return spooled
+
+
+
+# raised by the arrow reader when a row has a different number of fields (see "iter_columns")
+class __RaggedRow(Exception):
+    None
+
+
+
+class __NotClosing:
+
+    def __init__(self, f):
+        self.f = f
+
+    def __enter__(self):
+        return self.f
+
+    def __exit__(self, *args):
+        return False
+
+
+
+# to_array
+# RECEIVES: a list of fields (strings) and, optionally, a dtype
+# RETURNS: the fields as an array of that dtype or, if none is given, int64, float64 or object (text),
+# the first one that fits all the fields
+def to_array(fields, dtype=None):
+
+    if(dtype != None):
+        return np.asarray(fields, dtype=dtype)
+
+    for dtype in (np.int64, np.float64):
+        try:
+            return np.asarray(fields, dtype=dtype)
+        except (ValueError, OverflowError):
+            pass
+
+    array = np.empty(len(fields), dtype=object)
+    array[:] = fields
+    return array
+
+
+
+def __iter_columns_arrow(f, columns, delimiter, header, types, chunk_size):
+
+    import pyarrow
+    import pyarrow.csv
+
+    read_options = pyarrow.csv.ReadOptions(autogenerate_column_names=not header, block_size=chunk_size, use_threads=True)
+    ragged = []
+    def invalid_row_handler(row):
+        ragged.append(row)
+        return 'error'
+
+    parse_options = pyarrow.csv.ParseOptions(delimiter=delimiter, invalid_row_handler=invalid_row_handler)
+
+    # without a header, the columns are named "f0", "f1", ... by pyarrow. With a header, columns given by
+    # index can only be known after the header is read, so all the columns are converted
+    if(not header):
+        names = ['f' + str(column) for column in columns]
+    elif(all(isinstance(column, str) for column in columns)):
+        names = list(columns)
+    else:
+        names = None
+
+    convert_options = pyarrow.csv.ConvertOptions(
+        include_columns=list(dict.fromkeys(names)) if names != None else None,
+        column_types={name: pyarrow.from_numpy_dtype(np.dtype(types[column]))
+                      for name, column in zip(names or [], columns) if column in types}
+    )
+
+    try:
+        reader = pyarrow.csv.open_csv(f, read_options=read_options, parse_options=parse_options, convert_options=convert_options)
+    except pyarrow.ArrowInvalid as e:
+        if(len(ragged) > 0):
+            raise __RaggedRow()
+        if('Empty CSV' in str(e)):
+            return
+        raise RuntimeError('Could not read csv (' + str(e) + ')')
+
+    if(names == None):
+        all_names = reader.schema.names
+        names = [column if isinstance(column, str) else all_names[column] for column in columns]
+
+    while True:
+        try:
+            batch = reader.read_next_batch()
+        except StopIteration:
+            return
+        except pyarrow.ArrowInvalid as e:
+            if(len(ragged) > 0):
+                raise __RaggedRow()
+            raise RuntimeError('Could not read csv (' + str(e) + ')')
+
+        arrays = []
+        for name, column in zip(names, columns):
+            array = batch.column(batch.schema.get_field_index(name)).to_numpy(zero_copy_only=False)
+            if(column in types):
+                array = array.astype(types[column], copy=False)
+            arrays.append(array)
+        yield arrays
+
+
+
+def __iter_columns_csv(f, columns, delimiter, header, types, chunk_size, skip=0):
+
+    # empty lines are not rows (as in pyarrow)
+    reader = (row for row in csv.reader(io.TextIOWrapper(f, encoding='utf-8', newline=''), delimiter=delimiter)
+              if len(row) > 0)
+
+    indexes = list(columns)
+    if(header):
+        names = next(reader, [])
+        indexes = [names.index(column) if isinstance(column, str) else column for column in columns]
+
+    # rows already given by the arrow reader (see "iter_columns")
+    for _ in range(skip):
+        next(reader, None)
+
+    while True:
+        fields = [[] for _ in columns]
+        size = 0
+
+        for row in reader:
+            for i, index in enumerate(indexes):
+                fields[i].append(row[index])
+            size += sum(len(field) + 1 for field in row)
+            if(size >= chunk_size):
+                break
+
+        if(len(fields[0]) == 0):
+            return
+
+        yield [to_array(values, types.get(column)) for values, column in zip(fields, columns)]
@@ -0,0 +1,164 @@
+import configparser
+import contextlib
+import os
+import sqlite3
+import threading
+
+
+# This script was originaly created as part of the works on the creation of the CORAA dataset,
+# created to assist the training of portuguese automatic speech recognition tools
+
+# This is the connection layer used by the scripts that access CORAA's project database.
+# Connections are only opened when they are first needed, and are kept in a bounded pool to be reused
+# by the following queries. The database is configured by a file and/or environment variables:
+#
+#   file (path in CORAA_DB_CONFIG, "./database.ini" by default):    environment (overrides the file):
+#       [database]
+#       backend = mysql                                             CORAA_DB_BACKEND   ('mysql' or 'sqlite')
+#       host =                                                      CORAA_DB_HOST
+#       user =                                                      CORAA_DB_USER
+#       password =                                                  CORAA_DB_PASSWORD
+#       database =                                                  CORAA_DB_DATABASE
+#
+# With the sqlite backend, "database" is the path of the file (":memory:" by default), so the scripts can
+# run offline against local fixtures. Note that each connection to ":memory:" is a different database;
+# use an uri such as "file:fixture?mode=memory&cache=shared" to share one in-memory database in the pool
+
+# Infos regarding CORAA's original database such as queries and credentials have been removed
+# for security reasons
+
+
+
+# load_config
+# RECEIVES: optionally, the path of the configuration file
+# RETURNS: a dict with the backend, host, user, password and database
+def load_config(path=None):
+
+    config = {'backend': 'mysql', 'host': '', 'user': '', 'password': '', 'database': ''}
+
+    if(path == None):
+        path = os.environ.get('CORAA_DB_CONFIG', './database.ini')
+
+    parser = configparser.ConfigParser()
+    if(len(parser.read(path)) > 0 and parser.has_section('database')):
+        for key in config:
+            config[key] = parser.get('database', key, fallback=config[key])
+
+    for key in config:
+        config[key] = os.environ.get('CORAA_DB_' + key.upper(), config[key])
+
+    if(config['backend'] == 'sqlite' and config['database'] == ''):
+        config['database'] = ':memory:'
+
+    return config
+
+
+
+# connect
+# Opens a new connection
+# RECEIVES: a configuration, as returned by "load_config"
+# RETURNS: an open DB-API connection
+def connect(config):
+
+    if(config['backend'] == 'sqlite'):
+        return sqlite3.connect(config['database'], check_same_thread=False, uri=config['database'].startswith('file:'))
+
+    if(config['backend'] != 'mysql'):
+        raise RuntimeError('Unknown database backend \"' + config['backend'] + '\" (use \'mysql\' or \'sqlite\')')
+
+    # only imported when needed, so the sqlite backend works without the mysql driver
+    import mysql.connector
+
+    return mysql.connector.connect(
+        host=config['host'],
+        user=config['user'],
+        password=config['password'],
+        database=config['database']
+    )
+
+
+
+# ConnectionPool
+# a bounded pool of connections, opened lazily. At most "max_size" connections are in use at the same
+# time; asking for another one waits until one is given back
+class ConnectionPool:
+
+    def __init__(self, config=None, max_size=4):
+
+        self.config = config if config != None else load_config()
+        self.max_size = max_size
+        self.__idle = []
+        self.__slots = threading.BoundedSemaphore(max_size)
+        self.__lock = threading.Lock()
+
+
+    # acquire
+    # RECEIVES: optionally, the maximum time (in seconds) to wait for a free connection
+    # RETURNS: an open connection, reused from the pool when there is one
+    def acquire(self, timeout=None):
+
+        if(not self.__slots.acquire(timeout=timeout)):
+            raise RuntimeError('No database connection available (pool of ' + str(self.max_size) + ')')
+
+        with self.__lock:
+            if(len(self.__idle) > 0):
+                return self.__idle.pop()
+
+        try:
+            return connect(self.config)
+        except Exception:
+            self.__slots.release()
+            raise
+
+
+    # release
+    # Gives a connection back to the pool. Connections that may be in a bad state (discard=True) are
+    # closed instead of reused
+    def release(self, connection, discard=False):
+
+        if(discard):
+            connection.close()
+        else:
+            with self.__lock:
+                self.__idle.append(connection)
+
+        self.__slots.release()
+
+
+    # connection
+    # a context manager that acquires a connection and always gives it back
+    @contextlib.contextmanager
+    def connection(self, timeout=None):
+
+        connection = self.acquire(timeout)
+        try:
+            yield connection
+        except BaseException:
+            self.release(connection, discard=True)
+            raise
+        self.release(connection)
+
+
+    # close
+    # Closes all the connections that are not in use
+    def close(self):
+
+        with self.__lock:
+            idle, self.__idle = self.__idle, []
+
+        for connection in idle:
+            connection.close()
+
+
+
+default_pool = None
+
+# get_default_pool
+# RETURNS: the pool shared by the scripts, configured by "load_config" (created on the first call)
+def get_default_pool():
+
+    global default_pool
+    if(default_pool == None):
+        default_pool = ConnectionPool()
+
+    return default_pool
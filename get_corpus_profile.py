@@ -0,0 +1,218 @@
+import os
+import re
+import numpy as np
+import csv_ingest
+import plot_rendering
+import summary_stats
+from sql_bulk_lookup import resolve_paths
+import database_connections
+from segment_store import SegmentStore
+from sub_dataset_classifier import sub_datasets, get_sub_dataset_codes
+
+
+# This script was originaly created as part of the works on the creation of the CORAA dataset,
+# created to assist the training of portuguese automatic speech recognition tools
+
+# This script profiles the audios present in a given csv file in a single pass: the duration and the
+# transcription of each audio are retreived together (with the same queries), so the duration, the number
+# of words and the speech rate (words per second) of every audio are known at once. It creates:
+#   - "profile.json", with the stats of the three values for each sub-dataset and for all of them together,
+#     and their joint distribution (the correlation between duration and number of words and a 2-D histogram)
+#   - the plots of the speech rate distribution (as the ones of "get_time_mettrics_from_query")
+#   - a heat map of the joint distribution of duration and number of words for each sub-dataset
+
+# In order to use the script, you must call the "get_corpus_profile" function, providing a csv file
+# containing the file paths of the audios to be profiled, the id of the csv's column that contains the
+# file path, and an output directory where the profile can be saved. The script must also have access
+# to CORAA's project original database (configured as described in "database_connections")
+
+# Infos regarding CORAA's original database such as queries and credentials have been removed
+# for security reasons
+
+
+# query that returns (file_path, duration, transcription) rows, with "{}" where the list of file paths goes
+profile_query = """"""
+
+# number of bins of each axis of the joint distribution of duration and number of words
+joint_bins = 50
+
+plot_mode = 'minmax'
+plot_workers = os.cpu_count()    # number of processes that render the plots
+
+titles = ['Alip', 'TED', 'NURC-Recife', 'Coral Brasil', 'SP-2010']
+
+
+
+# get_corpus_profile
+# profiles a set of audios from the CORAA dataset (duration, number of words and speech rate)
+# RECEIVES: a csv file containing the file paths of the audios to be profiled, the id of the column containing
+# the file paths, the output directory where the profile will be saved and, optionally, the connection pool
+# to use (see "database_connections")
+# If "store_dir" is given, the durations and numbers of words are also kept in that segment store (see
+# "segment_store"), and only the audios missing one of them are retreived again
+def get_corpus_profile(file, id_col, output_dir, pool=None, store_dir=None):
+
+    # makes sure the output directory exists
+    if not os.path.isdir(output_dir):
+        os.mkdir(output_dir)
+
+    # reads the file path of each line of the input file (see "csv_ingest")
+    export_paths = csv_ingest.read_columns(file, [id_col], types={id_col: str})[0].tolist()
+    file_paths = []
+    for file_path in export_paths:
+        file_paths.append(re.sub('wavs/[a-zA-Z0-9_]+', 'data', file_path))
+
+    n = len(file_paths)
+    durations = np.full(n, np.nan)
+    words = np.full(n, -1, dtype=np.int64)
+
+    # the values already in the store don't need to be retreived again
+    if(store_dir != None):
+        store = SegmentStore(store_dir)
+        rows = {file_path: i for i, file_path in enumerate(store.file_paths())}
+        stored_durations = store.column('duration')
+        stored_words = store.column('words')
+        for i, export_path in enumerate(export_paths):
+            if(export_path in rows):
+                durations[i] = stored_durations[rows[export_path]]
+                words[i] = stored_words[rows[export_path]]
+    pending = np.flatnonzero(np.isnan(durations) | (words < 0))
+
+    # makes a few queries to the database, each with many file paths, to retreive the durations and the
+    # transcriptions together
+    missing = []
+    errored = []
+    if(len(pending) > 0):
+        if(pool == None):
+            pool = database_connections.get_default_pool()
+        with pool.connection() as connection:
+            found, missing, errored = resolve_paths(connection, profile_query, [file_paths[i] for i in pending], progress=True)
+
+        for i in pending:
+            if(file_paths[i] in found):
+                duration, transcription = found[file_paths[i]]
+                durations[i] = duration
+                words[i] = len(transcription.split(' '))
+
+        # keeps the new values in the store
+        if(store_dir != None):
+            store.update([export_paths[i] for i in pending], duration=durations[pending], words=words[pending])
+
+    known = ~np.isnan(durations) & (words >= 0)
+    print('Profile found for ' + str(np.count_nonzero(known)) + ' audios, ' + str(len(missing)) + ' missing, '
+          + str(len(errored)) + ' failed')
+    if(len(errored) > 0):
+        print('First error: ' + errored[0][1])
+
+    codes = get_sub_dataset_codes(file_paths)
+
+    unknown = np.count_nonzero(codes[known] == -1)
+    if(unknown > 0):
+        print(str(unknown) + ' audios didn\'t match any sub-dataset')
+
+    write_profile(durations[known], words[known], codes[known], output_dir)
+
+
+
+# get_profile
+# RECEIVES: arrays with the duration, the number of words and the sub-dataset code of each audio (see
+# "sub_dataset_classifier")
+# RETURNS: a dict where the key is the title of each sub-dataset (plus "Geral", for all of them together)
+# and the value is a dict with the stats of the duration, number of words and words per second (see
+# "summary_stats") and their joint distribution. The 2-D histograms of all the groups have the same bins
+def get_profile(durations, words, codes):
+
+    durations = np.asarray(durations, dtype=np.float64)
+    words = np.asarray(words, dtype=np.int64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = words / durations
+    rated = np.isfinite(rates)
+
+    x_edges = np.linspace(0, max(1, durations.max(initial=0)), joint_bins + 1)
+    y_edges = np.linspace(0, max(1, words.max(initial=0)), joint_bins + 1)
+
+    groups = [(title, codes == code) for code, title in enumerate(titles)]
+    groups.append(('Geral', codes >= 0))
+
+    profile = {}
+    for title, selected in groups:
+
+        d = durations[selected]
+        w = words[selected]
+        counts, _, _ = np.histogram2d(d, w, bins=[x_edges, y_edges])
+
+        profile[title] = {
+            'duration': summary_stats.summarize(d),
+            'words': summary_stats.summarize(w),
+            'words_per_second': summary_stats.summarize(rates[selected & rated]),
+            'joint': {
+                'correlation': np.corrcoef(d, w)[0, 1].item() if len(d) > 1 and d.std() > 0 and w.std() > 0 else np.nan,
+                'duration_edges': x_edges.tolist(),
+                'words_edges': y_edges.tolist(),
+                'counts': counts.astype(np.int64).tolist()
+            }
+        }
+
+    return profile
+
+
+
+# write_profile
+# saves the profile of a set of audios (see "get_profile") as "profile.json", the plots of the speech rate
+# of each sub-dataset and the heat maps of the joint distribution of duration and number of words
+# RECEIVES: arrays with the duration, the number of words and the sub-dataset code of each audio, the output
+# directory
+def write_profile(durations, words, codes, output_dir):
+
+    # the profile of a previous run is removed, as "write_summaries" adds the new one to it
+    if(os.path.exists(output_dir + '/profile.json')):
+        os.remove(output_dir + '/profile.json')
+
+    profile = get_profile(durations, words, codes)
+    summary_stats.write_summaries(output_dir + '/profile.json', profile)
+
+    for title, group in profile.items():
+        joint = group['joint']
+        plot_rendering.render_histogram2d(joint['counts'], joint['duration_edges'], joint['words_edges'],
+                                          'Perfil ' + title, output_dir, 'Segundos', 'Nº de palavras')
+
+    # the speech rate plots are rendered as the standard plot sets of the time and word scripts
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = words / durations
+    rated = np.isfinite(rates)
+
+    datasets = [rates[rated & (codes == code)] for code in range(len(sub_datasets))]
+    jobs = [('Palavras por segundo ' + title, [values], None) for values, title in zip(datasets, titles)]
+    jobs.append(('Palavras por segundo geral', [np.concatenate(datasets)], None))
+    jobs.append(('Palavras por segundo sobrepostos', datasets, ['Alip', 'Ted', 'Nurc-Re', 'Coral', 'SP2010']))
+    plot_rendering.render_jobs(jobs, output_dir, 'Palavras por segundo', plot_mode, plot_workers)
+
+
+
+# profile_from_store
+# profiles the audios of a segment store (see "segment_store") that have both duration and number of words,
+# without accessing the database or the export
+# RECEIVES: the directory of the store, the output directory where the profile will be saved
+def profile_from_store(store_dir, output_dir):
+
+    if not os.path.isdir(output_dir):
+        os.mkdir(output_dir)
+
+    store = SegmentStore(store_dir)
+    durations = store.column('duration')
+    words = store.column('words')
+    codes = store.column('subset')
+
+    known = ~np.isnan(durations) & (words >= 0)
+    write_profile(durations[known], words[known], codes[known], output_dir)
+
+
+
+
+
+
+
+# Main code-------------------------------------------------------
+if __name__ == '__main__':
+    get_corpus_profile('./export.csv', 0, './graphs/profile', store_dir='./segment_store')
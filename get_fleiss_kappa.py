@@ -1,5 +1,12 @@
+import concurrent.futures
+import contextlib
+import gzip
+import itertools
+import math
 import statistics
+import sys
 import numpy
+import csv_ingest
 
 
 # This script was originaly created as part of the works on the creation of the CORAA dataset, 
@@ -14,125 +21,268 @@ import numpy
 # As input, the script requires only a csv file with the columns indicating the avaluator's votes.
 # The file may have other types of columns as when, but the user is required to provide a list
 # of ids of the columns that represent the votes
+# The file is read in chunks, so its size is not limited by the available memory. It may also be
+# gzip compressed (".gz") or given as "-" to be read from the standard input
 input_file = './input.csv'
 category_columns = [2, 3]
 
 
+# kappa_from_totals
+# Calculate the kappa value from the only totals it depends on, so the votes themselves
+# don't need to be kept in memory. Every argument may carry a leading axis of matrices
+# RECEIVES: the number of subjects (N), the number of raters (n), the sum of the votes of each
+# category and the sum of the squared votes of every subject
+# RETURNS: an ndarray with one kappa value per matrix
+def kappa_from_totals(nSubjects, nRaters, col_sums, sum_sq):
+
+    nSubjects = numpy.asarray(nSubjects, dtype=numpy.int64).reshape(-1)
+    nRaters = numpy.asarray(nRaters, dtype=numpy.int64).reshape(-1)
+    col_sums = numpy.asarray(col_sums, dtype=numpy.int64).reshape(len(nRaters), -1)
+    sum_sq = numpy.asarray(sum_sq, dtype=numpy.int64).reshape(-1)
+
+    if((nSubjects == 0).any()):
+        raise RuntimeError("Matrix dimentions invalid (no subjects)")
+
+    if((nRaters < 2).any()):
+        raise RuntimeError("At least two raters per subject are required")
+
+    # pj---------------------------------------------------------
+    # -----------------------------------------------------------
+    # pj, the proportion of all assignments which were to the j-th category
+    assignments = nSubjects * nRaters
+    pj = col_sums / assignments[:, None]
+
+    # Checking if everything went well (up to floating point rounding)
+    pj_sum = pj.sum(axis=1)
+    if(not numpy.allclose(pj_sum, 1)):
+        raise RuntimeError("Sum of pj's returned \"" + str(pj_sum) + "\" (must be \"1\")")
+
+    # P----------------------------------------------------------
+    # -----------------------------------------------------------
+    # P, the mean of the pi's (the extent to which raters agree for the i-th subject).
+    # The sum of squares is kept in integers, so only the final division rounds
+    P = (sum_sq - assignments) / (assignments * (nRaters - 1))
+
+    # Pe---------------------------------------------------------
+    # -----------------------------------------------------------
+    Pe = numpy.einsum('mj,mj->m', pj, pj)
+
+    # kappa------------------------------------------------------
+    # -----------------------------------------------------------
+    # kappa, the actual kappa value (nan when every vote falls in a single category)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        kappa = (P - Pe) / (1 - Pe)
+
+    return kappa
+
+
+
+# fleiss_kappa_batch
+# Calculate the kappa value of one or many vote matrices in a single vectorized pass
+# RECEIVES: an integer ndarray of votes with shape (subjects, categories), or a 3-D stack of
+# such matrices with shape (matrices, subjects, categories)
+# RETURNS: the kappa value (2-D input) or an ndarray with one kappa value per matrix (3-D input)
+def fleiss_kappa_batch(matrix):
+
+    counts = numpy.asarray(matrix)
+
+    # Check if matrix is valid
+    if(counts.ndim not in (2, 3) or counts.shape[-1] == 0 or counts.shape[-2] == 0):
+        raise RuntimeError("Matrix dimentions invalid (expected subjects x categories, or a stack of those)")
+
+    if(counts.dtype.kind not in 'iub'):
+        raise RuntimeError("Votes must be integer counts, got dtype \"" + str(counts.dtype) + "\"")
+
+    single = counts.ndim == 2
+    counts = counts.reshape((-1,) + counts.shape[-2:]).astype(numpy.int64, copy=False)
+
+    # Get number of subjects and raters
+    nSubjects = counts.shape[1]                 # N
+    raters = counts.sum(axis=2)                 # votes given to each subject
+    nRaters = raters[:, 0]                      # n (one per matrix)
+
+    # Check if number of raters is consistent
+    inconsistent = raters != nRaters[:, None]
+    if(inconsistent.any()):
+        m, i = numpy.argwhere(inconsistent)[0]
+        where = '' if single else 'matrix ' + str(m) + ', '
+        raise RuntimeError("Number of raters must be constant for all subjects (" + where + "subject " + str(i)
+                           + " has " + str(raters[m, i]) + " votes, expected " + str(nRaters[m]) + ")")
+
+    kappa = kappa_from_totals(numpy.full(len(counts), nSubjects), nRaters, counts.sum(axis=1),
+                              numpy.einsum('mij,mij->m', counts, counts))
+
+    if(single):
+        return float(kappa[0])
+    return kappa
+
+
+
 # my_fleiss_kappa
 # Calculate a kappa value
 # RECEIVES: a matrix, composed of the csv's columns that represent the votes
 # RETURNS: the kappa value
 def my_fleiss_kappa(matrix):
 
-    # Checks and initial values----------------------------------
-    # -----------------------------------------------------------
-
     # Check if matrix is valid
     if(len(matrix) == 0 or len(matrix[0]) == 0):
         print("ERROR: Matrix dimentions invalid")
         return
 
-    # Get number of subjects, raters and categories
-    nSubjects = len(matrix)         # N
-    nRaters = 0                     # n
-    nCategories = len(matrix[0])    # k
+    return fleiss_kappa_batch(matrix)
 
-    for i in range(0, nCategories):
-        nRaters += matrix[0][i]
 
-    # Check if number of raters is consistent
-    for i in range(0, nSubjects):
 
-        raters = 0
-        for j in range(0, nCategories):
-            raters += matrix[i][j]
-        
-        if(raters != nRaters):
-            raise RuntimeError("Number of raters must be constant for all subjects")
 
-    # pj---------------------------------------------------------
-    # -----------------------------------------------------------
-    # pj, the proportion of all assignments which were to the j-th category
-    pj = []
 
-    # Calculating pj for each category
-    for j in range(0, nCategories):
+# bootstrap_shard
+# Calculates the kappa of 'n_resamples' bootstrap resamples of a vote matrix. Since only the
+# distinct rows matter for the kappa, drawing N subjects with replacement is the same as drawing
+# how many times each distinct row is picked, so each resample costs O(distinct rows), not O(N)
+# RECEIVES: the distinct rows of the matrix, how many times each one occurs, the number of resamples
+# and the seed of this shard
+# RETURNS: an ndarray with the kappa of every resample
+def bootstrap_shard(patterns, freq, n_resamples, seed):
 
-        sum = 0
+    rng = numpy.random.default_rng(seed)
+    nSubjects = int(freq.sum())
 
-        for i in range(0, nSubjects):
-            sum += matrix[i][j]
+    weights = rng.multinomial(nSubjects, freq / nSubjects, size=n_resamples)
+    col_sums = weights @ patterns
+    sum_sq = weights @ numpy.einsum('uj,uj->u', patterns, patterns)
 
-        pj.append(sum / (nSubjects * nRaters))
+    return kappa_from_totals(numpy.full(n_resamples, nSubjects), numpy.full(n_resamples, patterns[0].sum()),
+                             col_sums, sum_sq)
 
-    # Checking if everything went well
-    if(numpy.sum(pj) != 1):
-        raise RuntimeError("Sum of pj's returned \"" + str(numpy.sum(pj)) + "\" (must be exactly \"1\")")
 
-    # pi---------------------------------------------------------
-    # -----------------------------------------------------------
-    # pi, the extent to which raters agree for the i-th subject
-    pi = []
 
-    for i in range(0, nSubjects):
+# fleiss_kappa_ci
+# Calculate the kappa value of a vote matrix together with a confidence interval
+# RECEIVES: a vote matrix (subjects x categories), the method ('bootstrap' for percentile intervals
+# or 'jackknife' for normal intervals from the leave-one-out standard error), the number of bootstrap
+# resamples, the confidence level, the seed and the number of worker processes. Resamples are split
+# in shards of 'shard_size' with their own seeds, so the result doesn't depend on the number of workers
+# RETURNS: the kappa value, the lower and the upper bound of the interval
+def fleiss_kappa_ci(matrix, method='bootstrap', n_resamples=2000, confidence=0.95, seed=None, workers=1,
+                    shard_size=500):
 
-        sum = 0
+    kappa = fleiss_kappa_batch(matrix)          # also validates the matrix
+    patterns, freq = numpy.unique(numpy.asarray(matrix, dtype=numpy.int64), axis=0, return_counts=True)
+    nSubjects = int(freq.sum())
+    alpha = 1 - confidence
 
-        for j in range(0, nCategories):
-            sum += (matrix[i][j] * matrix[i][j])
-        
-        sum -= nRaters
+    if(method == 'jackknife'):
+        # the kappa without one subject only depends on which distinct row was left out
+        sq = numpy.einsum('uj,uj->u', patterns, patterns)
+        loo = kappa_from_totals(numpy.full(len(patterns), nSubjects - 1), numpy.full(len(patterns), patterns[0].sum()),
+                                (freq @ patterns)[None, :] - patterns, (freq @ sq) - sq)
+        mean = (freq @ loo) / nSubjects
+        se = math.sqrt((nSubjects - 1) / nSubjects * (freq @ (loo - mean) ** 2))
+        z = statistics.NormalDist().inv_cdf(1 - alpha / 2)
+        return kappa, kappa - z * se, kappa + z * se
 
-        pi.append(sum / (nRaters * (nRaters - 1)))
+    if(method != 'bootstrap'):
+        raise RuntimeError("Unknown confidence interval method \"" + str(method) + "\" (use 'bootstrap' or 'jackknife')")
 
-    # P----------------------------------------------------------
-    # -----------------------------------------------------------
-    # P, the mean of pi's
-    
-    P = statistics.mean(pi)
+    shards = [min(shard_size, n_resamples - i) for i in range(0, n_resamples, shard_size)]
+    seeds = numpy.random.SeedSequence(seed).spawn(len(shards))
 
-    # Pe---------------------------------------------------------
-    # -----------------------------------------------------------
-    # Pe
-    Pe = 0
+    if(workers > 1):
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(bootstrap_shard, itertools.repeat(patterns), itertools.repeat(freq), shards, seeds))
+    else:
+        results = list(map(bootstrap_shard, itertools.repeat(patterns), itertools.repeat(freq), shards, seeds))
 
-    for i in range(0, len(pj)):
-        Pe += (pj[i] * pj[i])
+    kappas = numpy.concatenate(results)
+    lower, upper = numpy.nanpercentile(kappas, [100 * alpha / 2, 100 * (1 - alpha / 2)])
 
-    # kappa------------------------------------------------------
-    # -----------------------------------------------------------
-    # kappa, the actual kappa value
+    return kappa, float(lower), float(upper)
 
-    kappa = (P - Pe) / (1 - Pe)
 
-    return kappa
 
+# FleissKappaAccumulator
+# Keeps the totals needed by the kappa (column sums and sum of squares) while the votes are
+# fed chunk by chunk, so the memory used depends only on the number of categories
+class FleissKappaAccumulator:
 
+    nSubjects = 0
+    nRaters = -1
 
+    def __init__(self, nCategories):
+        self.col_sums = numpy.zeros(nCategories, dtype=numpy.int64)
+        self.sum_sq = 0
 
+    # update
+    # RECEIVES: a chunk of the vote matrix (subjects x categories)
+    def update(self, chunk):
 
-# MAIN CODE------------------------------------------------------
-# -----------------------------------------------------------
-matrix = []
-lines = []
+        chunk = numpy.asarray(chunk, dtype=numpy.int64)
+        if(len(chunk) == 0):
+            return
+
+        raters = chunk.sum(axis=1)
+        if(self.nRaters == -1):
+            self.nRaters = int(raters[0])
 
-# builds the input matrix from the provided csv file
-with open(input_file, 'r') as f:
-    lines = f.readlines()
+        # Check if number of raters is consistent
+        inconsistent = numpy.flatnonzero(raters != self.nRaters)
+        if(len(inconsistent) > 0):
+            i = inconsistent[0]
+            raise RuntimeError("Number of raters must be constant for all subjects (subject " + str(self.nSubjects + i)
+                               + " has " + str(raters[i]) + " votes, expected " + str(self.nRaters) + ")")
 
-    for line in lines:
+        self.col_sums += chunk.sum(axis=0)
+        self.sum_sq += int(numpy.einsum('ij,ij->', chunk, chunk))
+        self.nSubjects += len(chunk)
 
-        line = line.split(';')
-        row = []
-        for column in category_columns:
-            row.append(int(line[column]))
-        
-        matrix.append(row)
+    # kappa
+    # RETURNS: the kappa value of all the votes seen so far
+    def kappa(self):
+        return float(kappa_from_totals(self.nSubjects, self.nRaters, self.col_sums, self.sum_sq)[0])
 
-f.close()
 
 
+# open_votes
+# Opens a vote file for reading as text. Files ending in ".gz" are decompressed on the fly
+# and "-" reads from the standard input
+def open_votes(path):
+
+    if(path == '-'):
+        return contextlib.nullcontext(sys.stdin)
+    if(path.endswith('.gz')):
+        return gzip.open(path, 'rt')
+    return open(path, 'r')
+
+
+
+# stream_fleiss_kappa
+# Calculate the kappa value of a csv file without loading it, reading about 'chunk_size' bytes at a time
+# RECEIVES: the path of the csv file (see "open_votes"), the list of ids of the columns that represent
+# the votes and the size of the chunks (see "csv_ingest")
+# RETURNS: the kappa value
+def stream_fleiss_kappa(path, columns, chunk_size=csv_ingest.default_chunk_size):
+
+    accumulator = FleissKappaAccumulator(len(columns))
+
+    with open_votes(path) as f:
+        types = {column: numpy.int64 for column in columns}
+        for chunk in csv_ingest.iter_columns(f, columns, delimiter=';', types=types, chunk_size=chunk_size):
+            accumulator.update(numpy.column_stack(chunk))
+
+    return accumulator.kappa()
+
+
+
+
+
+# MAIN CODE------------------------------------------------------
+# -----------------------------------------------------------
+# the input file can also be given as the first argument ("-" reads from stdin)
+if __name__ == '__main__':
+
+    if(len(sys.argv) > 1):
+        input_file = sys.argv[1]
 
-val = my_fleiss_kappa(matrix)
+    val = stream_fleiss_kappa(input_file, category_columns)
 
-print('Own fleiss Kappa value is: ' + str(val))
\ No newline at end of file
+    print('Own fleiss Kappa value is: ' + str(val))
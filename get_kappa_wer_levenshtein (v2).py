@@ -1,9 +1,20 @@
-import mysql.connector
 import statistics
-from statsmodels.stats.inter_rater import fleiss_kappa
-import textdistance
-import jiwer
 import os
+import mmap
+import time
+import collections
+import concurrent.futures
+import hashlib
+import sqlite3
+import queue
+import threading
+from get_fleiss_kappa import fleiss_kappa_ci, kappa_from_totals
+import bit_parallel_levenshtein
+import database_connections
+import csv_ingest
+import sub_dataset_classifier
+from transcript_tokenizer import TranscriptTokenizer
+import numpy
 
 
 # This script was originaly created as part of the works on the creation of the CORAA dataset, 
@@ -11,7 +22,7 @@ import os
 
 # This is a script that calculates many different mettrics from the final export of the
 # CORAA dataset. As input, the script requires only the final export csv file, and also access to the original
-# project's SQL database
+# project's SQL database (configured as described in "database_connections")
 
 # Infos regarding CORAA's original database such as queries and credentials have been removed 
 # for security reasons
@@ -22,6 +33,23 @@ log_level = 0 # 0 - no logging
               # 1 - minimal info
               # 2 - full progress report
 
+kappa_ci_method = None  # None - point estimate only
+                        # 'bootstrap' - percentile interval from bootstrap resamples
+                        # 'jackknife' - normal interval from the jackknife standard error
+kappa_ci_workers = 1    # number of processes used to compute the bootstrap resamples
+mettrics_workers = 1    # number of processes used to compute wer and levenshtein similarity
+
+# steps applied to the transcriptions before the WER is calculated, besides the whitespace normalization
+# (all disabled gives the same words as jiwer)
+wer_normalization = {'lowercase': False, 'remove_punctuation': False, 'drop_unintelligible': False}
+tokenizer = TranscriptTokenizer(**wer_normalization)
+
+# query that retrieves the id, file_path, text, task and invalid_user1 of every gold entry
+gold_query = """"""
+
+# file where the wer and levenshtein results of each gold entry are kept between runs (None to disable)
+mettrics_store = './mettrics_store.sqlite'
+
 
 
 
@@ -44,114 +72,290 @@ class GoldEntry:
         self.invalid_user1 = invalid_user1
         
 
-    def fix_gold_file_path(file_path):
+    # get_sub_dataset
+    # returns the sub-dataset of a file_path (see "sub_dataset_classifier")
+    def get_sub_dataset(file_path):
 
-        if('alip' in file_path):
-            return file_path.replace('data/', 'wavs/ALIP/')
-        elif('NURC_RE' in file_path):
-            return file_path.replace('data/', 'wavs/NURC_RE/')
-        elif('Ted_part' in file_path):
-            return file_path.replace('data/', 'wavs/TED/')
-        elif('CORAL' in file_path):
-            return file_path.replace('data/', 'wavs/CORAL/')
-        elif('_sp_.' in file_path):
-            return file_path.replace('data/', 'wavs/SP2010/')
-        else:
+        sub_dataset = sub_dataset_classifier.get_sub_dataset(file_path)
+        if(sub_dataset == None):
             raise RuntimeError('File_path \"' + file_path + '\" didn\'t match any of the expected paterns')
 
+        return sub_dataset
 
-# get_gold_set
-# Acesses the dataset and retrives infos from all the gold entries
-# RETURNS: a list of 'GoldEntry' objects, each representing one gold entry. Each object has: id, file_path, 
+
+    def fix_gold_file_path(file_path):
+
+        return file_path.replace('data/', 'wavs/' + GoldEntry.get_sub_dataset(file_path) + '/')
+
+
+# iter_gold_set
+# Acesses the dataset and retrives infos from all the gold entries, reading "batch_size" rows at a time
+# from an unbuffered cursor, so the whole gold set is never held in memory
+# RECEIVES: optionally, an open DB-API connection (e.g. sqlite3, for tests) and the query to run on it.
+# If no connection is given, one is taken from the default pool (see "database_connections") and given
+# back at the end
+# RETURNS: a generator of 'GoldEntry' objects, each representing one gold entry. Each object has: id, file_path,
 # text, task and invalid_user1
-def get_gold_set():
+def iter_gold_set(connection=None, query=gold_query, batch_size=1000):
 
     if(log_level >= 1): print('Retriving gold set info from database')
-    
 
-    # execute query and receives all information about the gold set
+    if(connection == None):
+        pool = database_connections.get_default_pool()
+        try:
+            connection = pool.acquire()
+        except Exception as e:
+            print('\nFailed to connect')
+            print(e)
+            exit()
+
+        # a connection left with unread rows (stream not consumed to the end) is not reused
+        discard = True
+        try:
+            yield from iter_gold_set(connection, query, batch_size)
+            discard = False
+        finally:
+            pool.release(connection, discard)
+        return
+
+    # execute query and receives the information about the gold set, one batch at a time
+    mycursor = connection.cursor()
+
     try:
-        mydb = mysql.connector.connect(
-            host="",
-            user="",
-            password="",
-            database=""
-        )
+        mycursor.execute(query)
 
-        mycursor = mydb.cursor()
+        if(log_level >= 2): print('Query returned')
 
-    except Exception as e:
-        print('\nFailed to connect')
-        print(e)
-        exit()
+        don = 0
+        while True:
+            rows = mycursor.fetchmany(batch_size)
+            if(len(rows) == 0):
+                break
 
+            for entry in rows:
+                yield GoldEntry(entry[0], GoldEntry.fix_gold_file_path(entry[1]), entry[2], entry[3], entry[4])
 
-    query = f""""""
+            # progress control
+            don += len(rows)
+            if(log_level >= 2): print(str(don) + ' gold entries read')
 
-    mycursor.execute(query)
-    result = mycursor.fetchall()
+    finally:
+        mycursor.close()
 
-    if(log_level >= 2): print('Query returned')
 
-    # uses infos returned in query to build the list of GoldEntry objects
-    gold = []
-    tot = len(result)
-    don = 0
 
-    for entry in result:
-        gold.append(GoldEntry(entry[0], GoldEntry.fix_gold_file_path(entry[1]), entry[2], entry[3], entry[4]))
+# get_gold_set
+# Acesses the dataset and retrives infos from all the gold entries
+# RETURNS: a list of 'GoldEntry' objects (see "iter_gold_set")
+def get_gold_set(connection=None, query=gold_query):
+
+    return list(iter_gold_set(connection, query))
+
+
+
+# version of the format of the export index: indexes saved with another version are rebuilt
+export_index_version = 3
+
 
-        # progress control
-        don += 1
-        if(don % int(tot/10) == 0):
-            if(log_level >= 2): print(str(round(100*don/tot, 2)) + '% done')
 
-    return gold
+# export_index_stamp
+# RECEIVES: the csv export file
+# RETURNS: the first line of the index of the export (see "build_export_index"), with the size and modification
+# time of the export and the version of the index
+def export_index_stamp(input_file):
+
+    stat = os.stat(input_file)
+    return str(stat.st_size) + '\t' + str(stat.st_mtime_ns) + '\t' + str(export_index_version) + '\n'
+
+
+
+# build_export_index
+# Goes throught the export file once, recording where the line of each file_path starts and how long
+# it is, and saves this index next to the export ("<export>.idx"), together with the size and modification
+# time of the export it was built from
+# The file_path of each line is parsed as csv (see "csv_ingest"), the same way the transcriptions are read by
+# "ExportLookup", so quoted file_paths are found too. Every line is indexed (a header line can't match the
+# file_path of a gold entry)
+# RECEIVES: the csv export file
+# RETURNS: a dict, where the key is the file_path and the value is a (byte offset, byte length) tuple
+def build_export_index(input_file):
+
+    if(log_level >= 1): print('Building export index')
+
+    index = {}
+    offset = 0
+    stamp = export_index_stamp(input_file)
+
+    with open(input_file, 'rb') as f:
+        for line in f:
+            fields = csv_ingest.parse_line(line.decode('utf-8'))
+            if(len(fields) > 0):
+                index[fields[0]] = (offset, len(line))
+            offset += len(line)
+
+    # the index is written to a temporary file first, so an interrupted run never leaves a broken index
+    try:
+        with open(input_file + '.idx.tmp', 'w', encoding='utf-8') as f:
+            f.write(stamp)
+            for file_path, (start, length) in index.items():
+                f.write(str(start) + '\t' + str(length) + '\t' + file_path + '\n')
+        os.replace(input_file + '.idx.tmp', input_file + '.idx')
+    except OSError as e:
+        if(log_level >= 1): print('Could not save export index (' + str(e) + ')')
+
+    return index
+
+
+
+# load_export_index
+# Loads the index saved by "build_export_index", rebuilding it if it is missing, if the export
+# changed (different size or modification time) since it was built or if it was built by another
+# version of the index
+# RECEIVES: the csv export file
+# RETURNS: a dict, where the key is the file_path and the value is a (byte offset, byte length) tuple
+def load_export_index(input_file):
+
+    try:
+        with open(input_file + '.idx', 'r', encoding='utf-8') as f:
+            if(f.readline() != export_index_stamp(input_file)):
+                return build_export_index(input_file)
+
+            index = {}
+            for line in f:
+                start, length, file_path = line.rstrip('\n').split('\t', 2)
+                index[file_path] = (int(start), int(length))
+            return index
+
+    except FileNotFoundError:
+        return build_export_index(input_file)
+
+
+
+# ExportLookup
+# a read-only dict-like view of the export file, where the key is the file_path and the value is its
+# transcription. Only the index of the export is kept in memory (see "load_export_index"): each
+# transcription is read from a memory map of the export when it is asked for
+class ExportLookup:
+
+    def __init__(self, input_file):
+
+        self.index = load_export_index(input_file)
+        self.file = open(input_file, 'rb')
+        self.mm = None
+        if(len(self.index) > 0):
+            self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __contains__(self, file_path):
+        return file_path in self.index
+
+    def __getitem__(self, file_path):
+        start, length = self.index[file_path]
+        line = self.mm[start:start + length].decode('utf-8')
+
+        # the transcription is everything after the 4th column: quoted commas are kept, and so are the commas
+        # of exports that didn't quote the transcriptions (see "csv_ingest")
+        return ','.join(csv_ingest.parse_line(line)[4:])
+
+    def close(self):
+        if(self.mm != None):
+            self.mm.close()
+        self.file.close()
 
 
 
 # get_gold_counterparts_in_export
 # RECEIVES: the csv export file and a list of GoldEntry objects, created by the "get_gold_set" function
-# Goes throught the export file looking for gold's normal counterparts. Builds a dict where the key is the
-# file_path and the value is its transcription
+# Looks up the gold's normal counterparts in the export file through its index (see "ExportLookup"),
+# reading only their lines. Builds a dict where the key is the file_path and the value is its transcription
 # RETURNS: a dict, where the key is the file_path and the value is its transcription
 def get_gold_counterparts_in_export(input_file, gold_set):
 
     if(log_level >= 1): print('Reading export lines')
 
-    # makes a list of all the gold entries' file_paths
-    gold_files = []
-    for audio in gold_set:
-        gold_files.append(audio.file_path)
+    export = ExportLookup(input_file)
+
+    if(log_level >= 2): print('Total of ' + str(len(export.index)) + ' indexed lines')
 
     # dict to be returned
     export_entries = {}
 
-    with open(input_file, 'r') as f:
-
-        lines = f.readlines()
-
-        tot_lines = len(lines)
-        don_lines = 0
+    # for each gold entry present in the export, reads only its line
+    for audio in gold_set:
+        if(audio.file_path in export):
+            export_entries[audio.file_path] = export[audio.file_path]
 
-        if(log_level >= 2): print('Total of ' + str(tot_lines) + ' lines')
+    export.close()
 
-        # see if the current line's file_path is from a gold entry. If so, updates in the dict
-        for line in lines:
+    return export_entries
 
-            file_path = line.split(',')[0]
-            text = ''.join(line.split(',')[4:])
 
-            if(file_path in gold_files):
-                export_entries[file_path] = text
 
-            don_lines += 1
+# broadcast_gold_stream
+# Feeds the same stream of gold entries (e.g. "iter_gold_set") to many consumers at once, so they run
+# as a pipeline over a single read of the gold set. Each consumer is a function that receives an iterable
+# of GoldEntry objects and runs in its own thread, reading from a bounded queue. The part of each consumer
+# after the end of the stream (calculations and prints) runs in the order the consumers were given
+# RECEIVES: the stream of gold entries, a list of consumers and the maximum number of entries waiting
+# to be read by each consumer
+# RETURNS: a list with the value returned by each consumer
+def broadcast_gold_stream(entries, consumers, queue_size=1000):
+
+    end = object()
+    failed = object()
+    queues = [queue.Queue(maxsize=queue_size) for _ in consumers]
+    finished = [threading.Event() for _ in consumers]
+    results = [None] * len(consumers)
+    errors = [None] * len(consumers)
+
+    def stream(i):
+        while True:
+            entry = queues[i].get()
+            if(entry is end):
+                break
+            if(entry is failed):
+                raise RuntimeError('Gold stream interrupted')
+            yield entry
+
+        if(i > 0):
+            finished[i - 1].wait()
+
+    def run(i):
+        try:
+            results[i] = consumers[i](stream(i))
+        except Exception as e:
+            errors[i] = e
+        finished[i].set()
+
+    # a consumer that already returned (or failed) is not fed anymore, so it can't block the stream
+    def put(i, item):
+        while not finished[i].is_set():
+            try:
+                queues[i].put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(consumers))]
+    for thread in threads:
+        thread.start()
+
+    last = failed
+    try:
+        for entry in entries:
+            for i in range(len(consumers)):
+                put(i, entry)
+        last = end
+    finally:
+        for i in range(len(consumers)):
+            put(i, last)
+        for thread in threads:
+            thread.join()
 
-            if(don_lines % int(tot_lines/10) == 0):
-                if(log_level >= 2): print(str(round(100*don_lines/tot_lines, 2)) + '% done')
-    f.close()
+    for error in errors:
+        if(error != None):
+            raise error
 
-    return export_entries
+    return results
 
 
 
@@ -162,12 +366,13 @@ def get_gold_counterparts_in_export(input_file, gold_set):
 # containing the gold's counterpart in the export file and their respective texts.
 # One can also decide to calculate the kappa only to task=0 ("anno"), task=1 ("trans"), or both ("all"), by setting the
 # "task" value
-# RETURNS: the kappa value
-def calculate_kappa(gold_set, export, task):
+# If "ci_method" is given ('bootstrap' or 'jackknife'), a 95% confidence interval is also calculated,
+# using "n_resamples" resamples split among "workers" processes. A "seed" makes it reproducible
+# RETURNS: the kappa value, or the kappa value and the lower and upper bounds of its interval if
+# "ci_method" was given
+def calculate_kappa(gold_set, export, task, ci_method=None, n_resamples=2000, seed=None, workers=1):
 
     if(log_level >= 1): print('Calculating kappa')
-    kappa_matrix = []
-    temp_kappa_matrix = []
 
     if(task == 'anno'):
         task = 0
@@ -176,6 +381,10 @@ def calculate_kappa(gold_set, export, task):
     else:
         task = -1
 
+    # counts how many audios had 0, 1 and 2 validations. Since every row of the kappa input matrix is
+    # [validations, 2-validations], these counts are enough to calculate it (see "calculate_grouped_kappa")
+    tally = [0, 0, 0]
+
     # for each audio in the gold set, checks if the audio was validated in the gold set
     # and also checks if the audio is present in the export file (since the export file 
     # only contains validated audios)
@@ -188,15 +397,141 @@ def calculate_kappa(gold_set, export, task):
             if(audio.invalid_user1 == 0 and audio.text != '###'):
                 validations += 1
 
-            kappa_matrix.append([validations, 2-validations])      # builds kappa input matrix
+            tally[validations] += 1
+
+    counts = numpy.array(tally)
+    rows = numpy.array([[0, 2], [1, 1], [2, 0]])
+    samples = int(counts.sum())
+    kappa = float(kappa_from_totals(samples, 2, counts @ rows, counts @ (rows ** 2).sum(axis=1))[0])   # calculates kappa
+
+    if(ci_method == None):
+        print('Kappa is ' + str(kappa) + ' (' + str(samples) + ' samples)')
+        return kappa
+
+    # the interval is calculated from the kappa input matrix, built from the counts (the order of its rows
+    # doesn't change the interval)
+    kappa_matrix = numpy.repeat(rows, counts, axis=0)
+    _, lower, upper = fleiss_kappa_ci(kappa_matrix, ci_method, n_resamples, seed=seed, workers=workers)
+
+    print('Kappa is ' + str(kappa) + ', 95% CI [' + str(lower) + ', ' + str(upper) + '] (' + ci_method + ', '
+          + str(samples) + ' samples)')
+
+    return kappa, lower, upper
+
+
+
+
+
+# calculate_grouped_kappa
+# calculates, in a single pass over the gold_set (get_gold_set function), the kappa of every combination
+# of task ("anno", "trans") and sub-dataset (see "sub_dataset_classifier"), plus the marginals of each task,
+# of each sub-dataset and of the whole set (marked as "all")
+# RECEIVES: a gold_set (get_gold_set function) and a dict (get_gold_counterparts_in_export function)
+# RETURNS: a list of (task, sub_dataset, kappa, number of samples) tuples
+def calculate_grouped_kappa(gold_set, export):
+
+    if(log_level >= 1): print('Calculating kappa by task and sub-dataset')
+    task_names = {0: 'anno', 1: 'trans'}
+
+    # for each group, counts how many audios had 0, 1 and 2 validations. Since every row of the
+    # kappa input matrix is [validations, 2-validations], these counts are enough to calculate it
+    tallies = {}
+
+    for audio in gold_set:
+
+        validations = 0
+        if(audio.file_path in export):
+            validations += 1
+        if(audio.invalid_user1 == 0 and audio.text != '###'):
+            validations += 1
+
+        task = task_names.get(audio.task, str(audio.task))
+        sub_dataset = GoldEntry.get_sub_dataset(audio.file_path)
+
+        for group in ((task, sub_dataset), (task, 'all'), ('all', sub_dataset), ('all', 'all')):
+            tallies.setdefault(group, [0, 0, 0])[validations] += 1
+
+    # sorts the groups by task and sub-dataset, leaving the marginals last (unknown task codes go
+    # right before them)
+    task_rank = {task: i for i, task in enumerate(list(task_names.values()) + ['all'])}
+    sub_dataset_rank = {sub_dataset: i for i, (sub_dataset, _) in enumerate(sub_dataset_classifier.patterns + [('all', '')])}
+    groups = sorted(tallies, key=lambda g: (task_rank.get(g[0], len(task_names) - 0.5), g[0], sub_dataset_rank[g[1]]))
+
+    # calculates the kappa of all groups at once
+    counts = numpy.array([tallies[g] for g in groups])
+    rows = numpy.array([[0, 2], [1, 1], [2, 0]])
+    samples = counts.sum(axis=1)
+    kappas = kappa_from_totals(samples, numpy.full(len(groups), 2), counts @ rows, counts @ (rows ** 2).sum(axis=1))
+
+    table = []
+    for (task, sub_dataset), kappa, n in zip(groups, kappas, samples):
+        table.append((task, sub_dataset, float(kappa), int(n)))
+        print(task.ljust(6) + sub_dataset.ljust(9) + 'Kappa is ' + str(kappa) + ' (' + str(n) + ' samples)')
+
+    return table
+
+
+
+
+
+# MettricsStore
+# a persistent store of the wer and levenshtein results of each gold entry, so a new export only needs to
+# compute the pairs that are new or changed. Results are keyed by the gold id, the hashes of the two
+# transcriptions and the normalization used for the WER (see "wer_normalization")
+class MettricsStore:
 
-    kappa = fleiss_kappa(kappa_matrix)                          # calculates kappa
+    def __init__(self, path, normalization):
 
-    print('Kappa is ' + str(kappa) + ' (' + str(len(kappa_matrix)) + ' samples)')
+        self.normalization = repr(sorted(normalization.items()))
+        self.db = sqlite3.connect(path)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS mettrics (
+                               gold_id TEXT, export_hash TEXT, gold_hash TEXT, normalization TEXT,
+                               distance INTEGER, ref_words INTEGER, lvs REAL,
+                               PRIMARY KEY (gold_id, export_hash, gold_hash, normalization))""")
 
-    return kappa
+    # key
+    # RETURNS: the key of a gold entry and its pair of transcriptions
+    def key(gold_id, t1, t2):
+        return (str(gold_id), hashlib.sha1(t1.encode('utf-8')).hexdigest(), hashlib.sha1(t2.encode('utf-8')).hexdigest())
 
+    # get
+    # RETURNS: the stored (distance, ref_words, lvs) of a key, or None if it was never computed
+    def get(self, key):
+        return self.db.execute("SELECT distance, ref_words, lvs FROM mettrics WHERE gold_id = ? AND export_hash = ? "
+                               "AND gold_hash = ? AND normalization = ?", key + (self.normalization,)).fetchone()
 
+    # put_many
+    # RECEIVES: a list of keys and a list with their (distance, ref_words, lvs) results
+    def put_many(self, keys, results):
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO mettrics VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                [key + (self.normalization,) + tuple(result) for key, result in zip(keys, results)])
+
+    def close(self):
+        self.db.close()
+
+
+
+# mettrics_chunk
+# calculates the wer and levenshtein results of a chunk of transcription pairs, so chunks can be
+# computed by different processes and merged afterwards
+# RECEIVES: a list of (export text, gold text) pairs
+# RETURNS: a list with the word distance (substitutions + deletions + insertions), the number of
+# reference (export) words and the levenshtein similarity of each pair
+def mettrics_chunk(pairs):
+
+    results = []
+
+    for t1, t2 in pairs:
+        ref = tokenizer.tokenize(t1)
+        hyp = tokenizer.tokenize(t2)
+        if(len(ref) == 0):
+            raise ValueError('Export transcription \"' + t1 + '\" has no words to compare')
+
+        distance = bit_parallel_levenshtein.levenshtein_distance(ref, hyp)
+        results.append((distance, len(ref), bit_parallel_levenshtein.normalized_similarity(t1, t2)))
+
+    return results
 
 
 
@@ -204,45 +539,144 @@ def calculate_kappa(gold_set, export, task):
 # calculates wer and levenshtein similarity based on the gold_set (get_gold_set function) and a 
 # dict (get_gold_counterparts_in_export function), containing the gold's counterpart in the export file and their 
 # respective texts.
+# The pairs of transcriptions are split in chunks of "chunk_size" pairs, computed by "workers" processes as the gold
+# set is read: at most two chunks per worker wait to be computed, and each chunk is added to the totals as soon as it
+# is done, so the memory used doesn't depend on the size of the gold set.
+# If a "store" file is given, the results of each gold entry are saved in it (see MettricsStore) and
+# only the pairs that are not there yet are computed. Results are always aggregated in gold set order,
+# so they don't depend on the number of workers or on what was already stored
 # RECEIVES: a gold_set (get_gold_set function) and a hashmap (get_gold_counterparts_in_export)
-# RETURNS: average WER and average levenshtein similarity
-def calculate_mettrics_from_transcription(gold_set, export):
+# RETURNS: average WER, average levenshtein similarity and corpus WER (total edits / total reference words)
+def calculate_mettrics_from_transcription(gold_set, export, workers=1, chunk_size=1000, store=None):
 
     if(log_level >= 1): print('Calculating wer and leveistain')
+
+    mettrics_store = None
+    if(store != None):
+        mettrics_store = MettricsStore(store, wer_normalization)
+
+    pool = None
+    if(workers > 1):
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+
+    # chunks waiting to be added to the totals, in gold set order
+    pending = collections.deque()
+
     n = 0
-    avg_wer = 0
-    avg_lvs = 0
+    computed = 0
+    sum_wer = 0
+    sum_lvs = 0
+    edits = 0
+    ref_words = 0
 
-    # For each audio in the gold set, if the audio has task 1 and has been validated by both gold set and
-    # final export, compares the two trascriptions to calculate wer and levenshtein distance   
-    for audio in gold_set:
+    # gets the results of a chunk that are already stored, and sends the missing pairs to be computed
+    def submit(pairs, keys):
 
-        if(audio.task == 1):
-            if(audio.file_path in export and audio.text != '###'):
+        results = [None] * len(pairs)
+        if(mettrics_store != None):
+            results = [mettrics_store.get(key) for key in keys]
 
-                t1 = (export[audio.file_path]).replace('\n', '')
-                t2 = (audio.text).replace('\n', '')
+        missing = [i for i in range(len(pairs)) if results[i] == None]
+        missing_pairs = [pairs[i] for i in missing]
 
-                n += 1
-                tmp_wer = jiwer.wer(t1, t2)
-                avg_wer += tmp_wer
-                tmp_lvn = textdistance.levenshtein.normalized_similarity(t1, t2)
-                avg_lvs += tmp_lvn
+        if(pool != None and len(missing) > 0):
+            job = pool.submit(mettrics_chunk, missing_pairs)
+        else:
+            job = mettrics_chunk(missing_pairs)
+
+        pending.append((keys, results, missing, job))
+
+    # waits for the oldest chunk, stores its new results and adds all of them to the totals
+    def collect():
+
+        nonlocal n, computed, sum_wer, sum_lvs, edits, ref_words
+
+        keys, results, missing, job = pending.popleft()
+        if(isinstance(job, concurrent.futures.Future)):
+            job = job.result()
+
+        for i, result in zip(missing, job):
+            results[i] = result
+
+        if(mettrics_store != None and len(missing) > 0):
+            mettrics_store.put_many([keys[i] for i in missing], job)
 
-    avg_wer /= n
-    avg_lvs /= n
+        for distance, words, lvs in results:
+            sum_wer += distance / words
+            sum_lvs += lvs
+            edits += distance
+            ref_words += words
+
+        n += len(results)
+        computed += len(missing)
+
+        if(log_level >= 2):
+            print(str(n) + ' pairs (' + str(len(missing)) + ' of ' + str(len(results)) + ' computed in this chunk)')
+
+    start_time = time.perf_counter()
+
+    # For each audio in the gold set, if the audio has task 1 and has been validated by both gold set and
+    # final export, the two trascriptions are compared to calculate wer and levenshtein distance
+    try:
+        pairs = []
+        keys = []
+        for audio in gold_set:
+
+            if(audio.task == 1):
+                if(audio.file_path in export and audio.text != '###'):
+
+                    t1 = (export[audio.file_path]).replace('\n', '')
+                    t2 = (audio.text).replace('\n', '')
+                    pairs.append((t1, t2))
+                    keys.append(MettricsStore.key(audio.id, t1, t2))
+
+                    if(len(pairs) == chunk_size):
+                        submit(pairs, keys)
+                        pairs = []
+                        keys = []
+                        while(len(pending) > 2 * max(1, workers)):
+                            collect()
+
+        if(len(pairs) > 0):
+            submit(pairs, keys)
+        while(len(pending) > 0):
+            collect()
+
+    finally:
+        if(pool != None):
+            pool.shutdown(cancel_futures=True)
+        if(mettrics_store != None):
+            mettrics_store.close()
+
+    elapsed = time.perf_counter() - start_time
+
+    if(n == 0):
+        print('No transcriptions to compare')
+        return None, None, None
+
+    avg_wer = sum_wer / n
+    avg_lvs = sum_lvs / n
+    corpus_wer = edits / ref_words
 
     print('Average WER: ' + str(avg_wer) + ' (' + str(n) + ' samples)')
+    print('Corpus WER: ' + str(corpus_wer) + ' (' + str(edits) + ' edits / ' + str(ref_words) + ' reference words)')
     print('Average Leveistain: ' + str(avg_lvs) + ' (' + str(n) + ' samples)')
+    print(str(computed) + ' pairs computed in ' + str(round(elapsed, 2)) + 's (' +
+          str(round(computed / elapsed, 2) if elapsed > 0 else 0) + ' pairs/s, ' + str(workers) + ' workers), ' +
+          str(n - computed) + ' reused from the store')
 
-    return avg_wer, avg_lvs
+    return avg_wer, avg_lvs, corpus_wer
 
 
 
 
 
 
-gold_set = get_gold_set()
-export = get_gold_counterparts_in_export(export_file, gold_set)
-calculate_kappa(gold_set, export, 'all')  # 'anno', 'trans' or 'all'
-calculate_mettrics_from_transcription(gold_set, export)
+if __name__ == '__main__':
+    export = ExportLookup(export_file)
+    broadcast_gold_stream(iter_gold_set(), [
+        lambda gold_set: calculate_kappa(gold_set, export, 'all', kappa_ci_method, workers=kappa_ci_workers),  # 'anno', 'trans' or 'all'
+        lambda gold_set: calculate_grouped_kappa(gold_set, export),
+        lambda gold_set: calculate_mettrics_from_transcription(gold_set, export, mettrics_workers, store=mettrics_store)
+    ])
+    export.close()
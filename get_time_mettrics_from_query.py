@@ -1,11 +1,14 @@
 import os
 import re
-import statistics
-import math
-import matplotlib
-import matplotlib.pyplot as plt
 import numpy as np
-import mysql.connector
+import csv_ingest
+import plot_rendering
+import summary_stats
+from sql_bulk_lookup import resolve_paths
+import database_connections
+from segment_store import SegmentStore
+from sub_dataset_classifier import sub_datasets, get_sub_dataset_codes
+import wav_durations
 
 
 # This script was originaly created as part of the works on the creation of the CORAA dataset, 
@@ -18,192 +21,180 @@ import mysql.connector
 # In order to use the script, you must call the "get_time_mettrics" function, providing a csv file
 # containing the file paths of the audios to be plotted, the id of the csv's column that contains the
 # file path, and an output directory where the plots can be saved as pngs. The script must also have access
-# to CORAA's project original database
+# to CORAA's project original database (configured as described in "database_connections"), or to the
+# wav files themselves (see "wav_durations")
 
 # Infos regarding CORAA's original database such as queries and credentials have been removed 
 # for security reasons
 
 
-mydb = mysql.connector.connect(
-  host="",
-  user="",
-  password="",
-  database=""
-)
+# query that returns (file_path, duration) rows, with "{}" where the list of file paths goes
+duration_query = """"""
 
-mycursor = mydb.cursor()
+# how the points of the scatter plots are rendered: 'minmax' or 'lttb' to plot only the points that can be seen
+# at the output resolution, 'raster' to plot all the points rasterized, 'full' to plot all of them (see "plot_downsampling")
+plot_mode = 'minmax'
+plot_workers = os.cpu_count()    # number of processes that render the plots
+
+# quantiles (in percent) written in the "infos" files, and whether they are estimated by a streaming sketch
+# instead of computed exactly, for sets of values too big to be sorted in memory (see "summary_stats")
+stats_quantiles = [25, 50, 75]
+stats_sketch = False
 
 
 
 # plot
 # Given a list of arrays of durations (each array is plotted with a different color and label), 
-# creates a scatter plot of said arrays and an "info" file with some useful stats
+# creates a scatter plot of said arrays (the stats are written apart, see "write_infos")
 # RECEIVES: a list of arrays containing durations, the title of the plot, the output directory 
-# in which to save the plot, a list of labels for each plotted array
-def plot(datasets, title='', output_dir='./', labels=None):
-    
-    # for each array in the list, sorts the array
-    ds = []
-    concat_times = []
-    for times in datasets:
-        times = sorted(times)
-        ds.append(times)
-        concat_times += times
-
-    concat_times = sorted(concat_times)
-
-    total = 0
-
-    # gets the total time of all the arrays combined
-    for times in ds:
-        for time in times:
-            total += time
+# in which to save the plot, a list of labels for each plotted array and how the points are rendered
+# (see "plot_mode"). The figure is released as soon as it is saved (see "plot_rendering")
+def plot(datasets, title='', output_dir='./', labels=None, mode=plot_mode):
     
-    # writes the "infos" file, with some stats about all the arrays
+    plot_rendering.render_scatter(datasets, title, output_dir, labels, 'Segundos', mode)
+
+
+
+# write_infos
+# writes the stats of a group of durations in the "infos" files of the output directory:
+# "infos.txt", to be read by people, and "infos.json", to be read by other scripts
+# RECEIVES: the summary of the durations (see "summary_stats"), its title and the output directory
+def write_infos(summary, title, output_dir):
+
     with open(output_dir + '/infos.txt', 'a') as f:
         f.write(title + '\n')
         f.write('Quartiles:' + '\n')
-        f.write('25%: ' + str(np.percentile(concat_times, 25)) + '\n')
-        f.write('50%: ' + str(np.percentile(concat_times, 50)) + '\n')
-        f.write('75%: ' + str(np.percentile(concat_times, 75)) + '\n')
+        for quantile, value in summary['quantiles'].items():
+            f.write(quantile + '%: ' + str(value) + '\n')
 
-        f.write('Total: ' + str(total) + ' segundos' + '\n')
-        f.write('Média: ' + str(statistics.mean(concat_times)) + '\n')
-        f.write('Desvio padrão: ' + str(statistics.stdev(concat_times)) + '\n')
-        f.write('Nº de amostras: ' + str(len(concat_times)) + '\n')
+        f.write('Total: ' + str(summary['total']) + ' segundos' + '\n')
+        f.write('Média: ' + str(summary['mean']) + '\n')
+        f.write('Desvio padrão: ' + str(summary['std']) + '\n')
+        f.write('Nº de amostras: ' + str(summary['count']) + '\n')
 
         f.write('----------------------------------------------' + '\n')
         f.write('----------------------------------------------' + '\n')
 
-
-    # Creates a scatter plot from the list of arrays. Each array will be repreented by a 
-    # separate color in the final plot. The arrays will be identified by the labels informed by the user
-    plots_time = []
-    for times in ds:
-        plot_time = []
-        for index, time in enumerate(times):
-            plot_time.append((index+1, time))
-        plots_time.append(plot_time)
-
-    num_of_samples = 0
-    for times in ds:
-        num_of_samples = max(num_of_samples, len(times))
-
-    max_y_value = 0
-    for times in ds:
-        max_y_value = max(max_y_value, times[-1])
-
-    fig = plt.figure()
-    ax = fig.add_subplot(1, 1, 1)
-
-    y_tick = max(1, math.floor(max_y_value/10))
-    major_y_ticks = np.arange(0, max_y_value+1, y_tick)
-    minor_y_ticks = np.arange(0, max_y_value+1, y_tick/2)
-
-    major_x_ticks = np.arange(0, num_of_samples+1, num_of_samples/5)
-
-    ax.set_xticks(major_x_ticks)
-    ax.set_yticks(major_y_ticks)
-    ax.set_yticks(minor_y_ticks, minor=True)
-
-    ax.grid(which='both')
-    ax.grid(which='major', color='#3489ff')
-
-    for index, plot_time in enumerate(plots_time):
-        if(labels != None):
-            plt.scatter(*zip(*plot_time), s=8, label=labels[index])
-        else:
-            plt.scatter(*zip(*plot_time), s=8)
-
-    if(labels != None):
-        plt.legend(loc='upper left', bbox_to_anchor=(1.05, 1), fancybox=True, shadow=True, ncol=1)
-    plt.title(title)
-    plt.xlabel('Nº da amostra')
-    plt.ylabel('Segundos')
-    plt.savefig(output_dir + '/' + title + '.png', bbox_inches='tight')
-
+    summary_stats.write_summaries(output_dir + '/infos.json', {title: summary})
 
 
 
 # get_time_mettrics
 # plots the time mettrics of a set of audios from the CORAA dataset
 # RECEIVES: a csv file containing the file paths of the audios to be plotted, the id 
-# of the column containing the file paths, the output directory where the plots will be saved
-def get_time_mettrics(file, id_col, output_dir):
-
-    # arrays to store the durations of each sub-dataset audios
-    sp_times = []
-    co_times = []
-    nurc_times = []
-    alip_times = []
-    ted_times = []
-    cnt = 0
-
-    # opens the input file
-    with open(file, 'r') as f:
-        lines = f.readlines()
+# of the column containing the file paths, the output directory where the plots will be saved and, optionally,
+# the connection pool to use (see "database_connections"). If "wav_dir" is given, the durations are read from
+# the headers of the wav files instead (the file paths of the csv being relative to "wav_dir", e.g. "wavs/ALIP/...")
+# If "store_dir" is given, the durations are also kept in that segment store (see "segment_store"), and the ones
+# already there are not retreived again
+def get_time_mettrics(file, id_col, output_dir, pool=None, wav_dir=None, store_dir=None):
 
     # makes sure the output directory exists
     if not os.path.isdir(output_dir):   
         os.mkdir(output_dir)
 
     
-    # for each line in the input file:
-    # retreives the file path from that line
-    # makes a query to the database to retreive that audio's duration
-    # saves the duration in the proper sub-dataset array, according to the id present in the file path
-    for line in lines:
-        if(cnt % 500 == 0):
-            print('Progress: ' + str(cnt) + ' of ' + str(len(lines)))
-        file_path = line.split(',')[id_col]
-
-        file_path = re.sub('wavs/[a-zA-Z0-9_]+', 'data', file_path)
-
-        query = f""""""
-
-        try:
-            mycursor.execute(query)
-            myresult = mycursor.fetchall()
-        except:
-            continue
-
-        if(len(myresult) == 0):
-            continue
-
-        dur = myresult[0][0]
-        if('_alip_.wav' in file_path):
-            alip_times.append(myresult[0][0])
-        elif('Ted_' in file_path):
-            ted_times.append(myresult[0][0])
-        elif('NURC_RE' in file_path):
-            nurc_times.append(myresult[0][0])
-        elif('_CO_' in file_path):
-            co_times.append(myresult[0][0])
-        elif('_sp_.wav' in file_path):
-            sp_times.append(myresult[0][0])
-        else:
-            print('Other dataset found: ' + file_path)
-
-        with open('./temp' + str(c) + '.csv', 'a') as g:
-            g.write(str(id)+','+str(dur)+'\n')
-
-        cnt += 1
-
-
-    try:
-        os.system('rm ' + output_dir + '/infos.txt')
-    except:
+    # reads the file path of each line of the input file (see "csv_ingest")
+    export_paths = csv_ingest.read_columns(file, [id_col], types={id_col: str})[0].tolist()
+    file_paths = []
+    for file_path in export_paths:
+        file_paths.append(re.sub('wavs/[a-zA-Z0-9_]+', 'data', file_path))
+
+    # durations already in the store don't need to be retreived again
+    durations = {}
+    if(store_dir != None):
+        store = SegmentStore(store_dir)
+        stored = dict(zip(store.file_paths(), store.column('duration')))
+        for export_path, file_path in zip(export_paths, file_paths):
+            if(export_path in stored and not np.isnan(stored[export_path])):
+                durations[file_path] = float(stored[export_path])
+    pending = [i for i in range(len(file_paths)) if file_paths[i] not in durations]
+
+    missing = []
+    errored = []
+    if(len(pending) == 0):
         None
 
+    elif(wav_dir != None):
+        # reads the audios' durations directly from the headers of the wav files
+        wav_paths = [os.path.join(wav_dir, export_paths[i]) for i in pending]
+        found, missing, errored = wav_durations.read_wav_durations(wav_paths)
+        for wav_path, i in zip(wav_paths, pending):
+            if(wav_path in found):
+                durations[file_paths[i]] = found[wav_path]
+
+    else:
+        # makes a few queries to the database, each with many file paths, to retreive the audios' durations
+        if(pool == None):
+            pool = database_connections.get_default_pool()
+        with pool.connection() as connection:
+            found, missing, errored = resolve_paths(connection, duration_query, [file_paths[i] for i in pending], progress=True)
+        durations.update(found)
+
+    # keeps the new durations in the store
+    if(store_dir != None):
+        store.update([export_paths[i] for i in pending], duration=[durations.get(file_paths[i], np.nan) for i in pending])
+
+    print('Durations found for ' + str(len(durations)) + ' audios, ' + str(len(missing)) + ' missing, '
+          + str(len(errored)) + ' failed')
+    if(len(errored) > 0):
+        print('First error: ' + errored[0][1])
+
+    # separates the durations by sub-dataset, according to the id present in the file path
+    found_paths = [file_path for file_path in file_paths if file_path in durations]
+    values = np.array([durations[file_path] for file_path in found_paths], dtype=float)
+    codes = get_sub_dataset_codes(found_paths)
+
+    unknown = np.count_nonzero(codes == -1)
+    if(unknown > 0):
+        print(str(unknown) + ' audios didn\'t match any sub-dataset')
+
+    # Having now an array with the durations of all the audios separeted by sub-dataset, plots each array
+    plot_times([values[codes == code] for code in range(len(sub_datasets))], output_dir)
+
+
+
+# plot_times
+# creates the standard set of plots (one for each sub-dataset, one for all of them together and one with
+# all of them overlapping) and their "infos" file
+# RECEIVES: a list with the arrays of durations of each sub-dataset, in the order of
+# sub_dataset_classifier.sub_datasets (Alip, TED, NURC-Recife, Coral Brasil, SP-2010), the output directory
+# where the plots will be saved
+def plot_times(datasets, output_dir):
+
+    # the infos files of a previous run are removed, as the stats are appended to them (see "write_infos")
+    for name in ('/infos.txt', '/infos.json'):
+        if(os.path.exists(output_dir + name)):
+            os.remove(output_dir + name)
+
+    datasets = [np.asarray(values, dtype=float) for values in datasets]
+    groups = datasets + [np.concatenate(datasets)]
+    titles = ['Tempos Alip', 'Tempos TED', 'Tempos NURC-Recife', 'Tempos Coral Brasil', 'Tempos SP-2010',
+              'Tempos geral']
+
+    # the stats of each sub-dataset and of all of them together are computed once, apart from the plots
+    # (the overlapping plot has the same stats as the general one)
+    summaries = [summary_stats.summarize(values, stats_quantiles, stats_sketch) for values in groups]
+    for summary, title in zip(summaries + [summaries[-1]], titles + ['Tempos sobrepostos']):
+        write_infos(summary, title, output_dir)
+
+    # the plots are independent of each other, so they are rendered by a pool of processes
+    jobs = [(title, [values], None) for values, title in zip(groups, titles)]
+    jobs.append(('Tempos sobrepostos', datasets, ['Alip', 'Ted', 'Nurc-Re', 'Coral', 'SP2010']))
+    plot_rendering.render_jobs(jobs, output_dir, 'Segundos', plot_mode, plot_workers)
+
+
+
+# plot_times_from_store
+# creates the standard set of plots (see "plot_times") from a segment store (see "segment_store"), without
+# accessing the database or the export
+# RECEIVES: the directory of the store, the output directory where the plots will be saved
+def plot_times_from_store(store_dir, output_dir):
+
+    if not os.path.isdir(output_dir):
+        os.mkdir(output_dir)
 
-    # Having now an array with the duration of all the audios separeted by sub-dataset, plots each array
-    plot([alip_times], 'Tempos Alip', output_dir)
-    plot([ted_times], 'Tempos TED', output_dir)
-    plot([nurc_times], 'Tempos NURC-Recife', output_dir)
-    plot([co_times], 'Tempos Coral Brasil', output_dir)
-    plot([sp_times], 'Tempos SP-2010', output_dir)
-    plot([alip_times + ted_times + nurc_times + co_times + sp_times], 'Tempos geral', output_dir)
-    plot([alip_times, ted_times, nurc_times, co_times, sp_times], 'Tempos sobrepostos', output_dir, ['Alip', 'Ted', 'Nurc-Re', 'Coral', 'SP2010'])
+    plot_times(SegmentStore(store_dir).select('duration'), output_dir)
 
 
 
@@ -212,4 +203,5 @@ def get_time_mettrics(file, id_col, output_dir):
 
 
 # Main code-------------------------------------------------------
-get_time_mettrics('./export.csv', 0, './graphs/times')
+if __name__ == '__main__':
+    get_time_mettrics('./export.csv', 0, './graphs/times', store_dir='./segment_store')
@@ -1,11 +1,13 @@
 import os
 import re
-import statistics
-import math
-import matplotlib
-import matplotlib.pyplot as plt
 import numpy as np
-import mysql.connector
+import csv_ingest
+import plot_rendering
+import summary_stats
+from sql_bulk_lookup import resolve_paths
+import database_connections
+from segment_store import SegmentStore
+from sub_dataset_classifier import sub_datasets, get_sub_dataset_codes
 
 
 # This script was originaly created as part of the works on the creation of the CORAA dataset, 
@@ -18,194 +20,188 @@ import mysql.connector
 # In order to use the script, you must call the "get_word_mettrics" function, providing a csv file
 # containing the transcriptions to be plotted, the id of the csv's column that contains the
 # file path, and an output directory where the plots can be saved as pngs. The script must also have access
-# to CORAA's project original database
+# to CORAA's project original database (configured as described in "database_connections")
 
 # Infos regarding CORAA's original database such as queries and credentials have been removed 
 # for security reasons
  
  
-mydb = mysql.connector.connect(
-  host="",
-  user="",
-  password="",
-  database=""
-)
+# query that returns (file_path, transcription) rows, with "{}" where the list of file paths goes
+transcription_query = """"""
 
-mycursor = mydb.cursor()
+# how the points of the scatter plots are rendered: 'minmax' or 'lttb' to plot only the points that can be seen
+# at the output resolution, 'raster' to plot all the points rasterized, 'full' to plot all of them (see "plot_downsampling")
+plot_mode = 'minmax'
+plot_workers = os.cpu_count()    # number of processes that render the plots
+
+# quantiles (in percent) written in the "infos" files, and whether they are estimated by a streaming sketch
+# instead of computed exactly, for sets of values too big to be sorted in memory (see "summary_stats")
+stats_quantiles = [25, 50, 75]
+stats_sketch = False
 
 
 # plot
 # Given a list of arrays of number of words (each array is plotted with a different color and label), 
-# creates a scatter plot of said arrays and an "info" file with some useful stats
+# creates a scatter plot of said arrays (the stats are written apart, see "write_infos")
 # RECEIVES: a list of arrays containing number of words, the title of the plot, the output directory 
-# in which to save the plot, a list of labels for each plotted array
-def plot(datasets, title='', output_dir='./', labels=None):
+# in which to save the plot, a list of labels for each plotted array and how the points are rendered
+# (see "plot_mode"). The figure is released as soon as it is saved (see "plot_rendering")
+def plot(datasets, title='', output_dir='./', labels=None, mode=plot_mode):
     
-    # for each array in the list, sorts the array
-    ds = []
-    concat_words = []
-    for words in datasets:
-        words = sorted(words)
-        ds.append(words)
-        concat_words += words
+    plot_rendering.render_scatter(datasets, title, output_dir, labels, 'Nº de palavras', mode)
 
-    concat_words = sorted(concat_words)
 
-    total = 0
 
-    # gets the total number of words of all the arrays combined
-    for words in ds:
-        for word in words:
-            total += word
+# write_infos
+# writes the stats of a group of numbers of words in the "infos" files of the output directory:
+# "infos.txt", to be read by people, and "infos.json", to be read by other scripts
+# RECEIVES: the summary of the numbers of words (see "summary_stats"), its title and the output directory
+def write_infos(summary, title, output_dir):
 
-    # writes the "infos" file, with some stats about all the arrays
     with open(output_dir + '/infos.txt', 'a') as f:
         f.write(title + '\n')
         f.write('Quartis:' + '\n')
-        f.write('25%: ' + str(np.percentile(concat_words, 25)) + '\n')
-        f.write('50%: ' + str(np.percentile(concat_words, 50)) + '\n')
-        f.write('75%: ' + str(np.percentile(concat_words, 75)) + '\n')
+        for quantile, value in summary['quantiles'].items():
+            f.write(quantile + '%: ' + str(value) + '\n')
 
-        f.write('Total: ' + str(total) + ' palavras' + '\n')
-        f.write('Média: ' + str(statistics.mean(concat_words)) + '\n')
-        f.write('Desvio padrão: ' + str(statistics.stdev(concat_words)) + '\n')
-        f.write('Nº de amostras: ' + str(len(concat_words)) + '\n')
+        f.write('Total: ' + str(summary['total']) + ' palavras' + '\n')
+        f.write('Média: ' + str(summary['mean']) + '\n')
+        f.write('Desvio padrão: ' + str(summary['std']) + '\n')
+        f.write('Nº de amostras: ' + str(summary['count']) + '\n')
 
         f.write('----------------------------------------------' + '\n')
         f.write('----------------------------------------------' + '\n')
 
+    summary_stats.write_summaries(output_dir + '/infos.json', {title: summary})
 
-    # Creates a scatter plot from the list of arrays. Each array will be repreented by a 
-    # separate color in the final plot. The arrays will be identified by the labels informed by the user
-    plots_word = []
-    for words in ds:
-        plot_word = []
-        for index, word in enumerate(words):
-            plot_word.append((index+1, word))
-        plots_word.append(plot_word)
 
 
-    num_of_samples = 0
-    for words in ds:
-        num_of_samples = max(num_of_samples, len(words))
+# get_word_mettrics
+# plots the word mettrics of a set of transcriptions from the CORAA dataset
+# RECEIVES: a csv file containing the transcriptions to be plotted, the id 
+# of the column containing the transcriptions, the output directory where the plots will be saved and, optionally,
+# the connection pool to use (see "database_connections")
+# If "store_dir" is given, the numbers of words are also kept in that segment store (see "segment_store"), and the
+# ones already there are not retreived again
+# If "text_col" is given, the transcriptions are read from that column of the csv file itself, and the database is
+# not accessed
+def get_word_mettrics(file, id_col, output_dir, pool=None, store_dir=None, text_col=None):
 
-    max_y_value = 0
-    for words in ds:
-        max_y_value = max(max_y_value, words[-1])
+    # makes sure the output directory exists
+    if not os.path.isdir(output_dir):   
+        os.mkdir(output_dir)
 
+    # reads the file path (and, if asked for, the transcription) of each line of the input file (see "csv_ingest")
+    if(text_col != None):
+        export_paths, texts = csv_ingest.read_columns(file, [id_col, text_col], types={id_col: str, text_col: str})
+        export_paths = export_paths.tolist()
+    else:
+        export_paths = csv_ingest.read_columns(file, [id_col], types={id_col: str})[0].tolist()
+    file_paths = []
+    for file_path in export_paths:
+        file_paths.append(re.sub('wavs/[a-zA-Z0-9_]+', 'data', file_path))
+
+    # numbers of words already in the store don't need to be retreived again
+    word_cnts = {}
+    if(store_dir != None):
+        store = SegmentStore(store_dir)
+        stored = dict(zip(store.file_paths(), store.column('words')))
+        for export_path, file_path in zip(export_paths, file_paths):
+            if(export_path in stored and stored[export_path] >= 0):
+                word_cnts[file_path] = int(stored[export_path])
+    pending = [i for i in range(len(file_paths)) if file_paths[i] not in word_cnts]
+
+    missing = []
+    errored = []
+    if(len(pending) == 0):
+        None
 
-    fig = plt.figure()
-    ax = fig.add_subplot(1, 1, 1)
+    elif(text_col != None):
+        # counts the words of the transcriptions of the csv file itself
+        for i in pending:
+            word_cnts[file_paths[i]] = len(texts[i].split(' '))
 
+    else:
+        # makes a few queries to the database, each with many file paths, to retreive the transcriptions
+        if(pool == None):
+            pool = database_connections.get_default_pool()
+        with pool.connection() as connection:
+            transcriptions, missing, errored = resolve_paths(connection, transcription_query, [file_paths[i] for i in pending], progress=True)
 
-    y_tick = max(1, math.floor(max_y_value/10))
-    major_y_ticks = np.arange(0, max_y_value+1, y_tick)
-    minor_y_ticks = np.arange(0, max_y_value+1, y_tick/2)
+        for file_path, transcription in transcriptions.items():
+            word_cnts[file_path] = len(transcription.split(' '))
 
-    major_x_ticks = np.arange(0, num_of_samples+1, num_of_samples/5)
+    # keeps the new numbers of words in the store
+    if(store_dir != None):
+        store.update([export_paths[i] for i in pending], words=[word_cnts.get(file_paths[i], -1) for i in pending])
 
-    ax.set_xticks(major_x_ticks)
-    ax.set_yticks(major_y_ticks)
-    ax.set_yticks(minor_y_ticks, minor=True)
+    print('Numbers of words found for ' + str(len(word_cnts)) + ' audios, ' + str(len(missing)) + ' missing, '
+          + str(len(errored)) + ' failed')
+    if(len(errored) > 0):
+        print('First error: ' + errored[0][1])
 
-    ax.grid(which='both')
-    ax.grid(which='major', color='#3489ff')
+    # separates the numbers of words by sub-dataset, according to the id present in the file path
+    found_paths = [file_path for file_path in file_paths if file_path in word_cnts]
+    values = np.array([word_cnts[file_path] for file_path in found_paths], dtype=int)
+    codes = get_sub_dataset_codes(found_paths)
 
-    for index, plot_word in enumerate(plots_word):
-        if(labels != None):
-            plt.scatter(*zip(*plot_word), s=8, label=labels[index])
-        else:
-            plt.scatter(*zip(*plot_word), s=8)
+    unknown = np.count_nonzero(codes == -1)
+    if(unknown > 0):
+        print(str(unknown) + ' audios didn\'t match any sub-dataset')
 
-    if(labels != None):
-        plt.legend(loc='upper left', bbox_to_anchor=(1.05, 1), fancybox=True, shadow=True, ncol=1)
-    plt.title(title)
-    plt.xlabel('Nº da amostra')
-    plt.ylabel('Nº de palavras')
-    plt.savefig(output_dir + '/' + title + '.png', bbox_inches='tight')
+    # Having now an array with the numbers of words of all the audios separeted by sub-dataset, plots each array
+    plot_words([values[codes == code] for code in range(len(sub_datasets))], output_dir)
 
 
 
-# get_word_mettrics
-# plots the word mettrics of a set of transcriptions from the CORAA dataset
-# RECEIVES: a csv file containing the transcriptions to be plotted, the id 
-# of the column containing the transcriptions, the output directory where the plots will be saved
-def get_word_mettrics(file, id_col, output_dir):
+# plot_words
+# creates the standard set of plots (one for each sub-dataset, one for all of them together and one with
+# all of them overlapping) and their "infos" file
+# RECEIVES: a list with the arrays of numbers of words of each sub-dataset, in the order of
+# sub_dataset_classifier.sub_datasets (Alip, TED, NURC-Recife, Coral Brasil, SP-2010), the output directory
+# where the plots will be saved
+def plot_words(datasets, output_dir):
 
-    # arrays to store the number of words of each sub-dataset transcriptions
-    sp_words = []
-    co_words = []
-    nurc_words = []
-    alip_words = []
-    ted_words = []
-    cnt = 0
+    # the infos files of a previous run are removed, as the stats are appended to them (see "write_infos")
+    for name in ('/infos.txt', '/infos.json'):
+        if(os.path.exists(output_dir + name)):
+            os.remove(output_dir + name)
 
-    # opens the input file
-    with open(file, 'r') as f:
-        lines = f.readlines()
+    datasets = [np.asarray(values, dtype=np.int64) for values in datasets]
+    groups = datasets + [np.concatenate(datasets)]
+    titles = ['No palavras Alip', 'No palavras TED', 'No palavras NURC-Recife', 'No palavras Coral Brasil', 'No palavras SP-2010',
+              'No palavras geral']
 
-    # makes sure the output directory exists
-    if not os.path.isdir(output_dir):   
+    # the stats of each sub-dataset and of all of them together are computed once, apart from the plots
+    # (the overlapping plot has the same stats as the general one)
+    summaries = [summary_stats.summarize(values, stats_quantiles, stats_sketch) for values in groups]
+    for summary, title in zip(summaries + [summaries[-1]], titles + ['No palavras sobrepostos']):
+        write_infos(summary, title, output_dir)
+
+    # the plots are independent of each other, so they are rendered by a pool of processes
+    jobs = [(title, [values], None) for values, title in zip(groups, titles)]
+    jobs.append(('No palavras sobrepostos', datasets, ['Alip', 'Ted', 'Nurc-Re', 'Coral', 'SP2010']))
+    plot_rendering.render_jobs(jobs, output_dir, 'Nº de palavras', plot_mode, plot_workers)
+
+
+
+# plot_words_from_store
+# creates the standard set of plots (see "plot_words") from a segment store (see "segment_store"), without
+# accessing the database or the export
+# RECEIVES: the directory of the store, the output directory where the plots will be saved
+def plot_words_from_store(store_dir, output_dir):
+
+    if not os.path.isdir(output_dir):
         os.mkdir(output_dir)
 
-    # for each line in the input file:
-    # retreives the transcription from that line
-    # saves the transcription in the proper sub-dataset array, according to the id present in the file path
-    for line in lines:
-        if(cnt % 500 == 0):
-            print('Progress: ' + str(cnt) + ' of ' + str(len(lines)))
-        file_path = line.split(',')[id_col]
-
-        file_path = re.sub('wavs/[a-zA-Z0-9_]+', 'data', file_path)
-
-        query = f""""""
-
-        try:
-            mycursor.execute(query)
-            myresult = mycursor.fetchall()
-        except:
-            continue
-
-        if(len(myresult) == 0):
-            continue
-
-        word_cnt = len(myresult[0][0].split(' '))
-
-        if('_alip_.wav' in file_path):
-            alip_words.append(word_cnt)
-        elif('Ted_' in file_path):
-            ted_words.append(word_cnt)
-        elif('NURC_RE' in file_path):
-            nurc_words.append(word_cnt)
-        elif('_CO_' in file_path):
-            co_words.append(word_cnt)
-        elif('_sp_.wav' in file_path):
-            sp_words.append(word_cnt)
-        else:
-            print('Other dataset found: ' + file_path)
-
-        with open('./temp' + str(c) + '.csv', 'a') as g:
-            g.write(str(id)+','+str(word_cnt)+'\n')
-
-        cnt += 1
-
-    try:
-        os.system('rm ' + output_dir + '/infos.txt')
-    except:
-        None
+    plot_words(SegmentStore(store_dir).select('words'), output_dir)
+
 
 
-    # Having now an array with the number of words of all the transcriptions separeted by sub-dataset, plots each array
-    plot([alip_words], 'No palavras Alip', output_dir)
-    plot([ted_words], 'No palavras TED', output_dir)
-    plot([nurc_words], 'No palavras NURC-Recife', output_dir)
-    plot([co_words], 'No palavras Coral Brasil', output_dir)
-    plot([sp_words], 'No palavras SP-2010', output_dir)
-    plot([alip_words + ted_words + nurc_words + co_words + sp_words], 'No palavras geral', output_dir)
-    plot([alip_words, ted_words, nurc_words, co_words, sp_words], 'No palavras sobrepostos', output_dir, ['Alip', 'Ted', 'Nurc-Re', 'Coral', 'SP2010'])
 
 
 
 
 # Main code-------------------------------------------------------
-get_word_mettrics('./export.csv', 0, './graphs/words')
+if __name__ == '__main__':
+    get_word_mettrics('./export.csv', 0, './graphs/words', store_dir='./segment_store')
@@ -0,0 +1,118 @@
+import contextlib
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+
+# This script was originaly created as part of the works on the creation of the CORAA dataset,
+# created to assist the training of portuguese automatic speech recognition tools
+
+# This script keeps an on-disk cache of the text extracted from pdf files, so the (slow) pdf parsing is done
+# once per file, and a cleanup that changes can be run again from the cached text. Each entry holds the text
+# of every page of one pdf, one json string per line, and is found by the sha256 of the content of the pdf
+# and the version of the extractor: a pdf that changes, or a new extractor, gets a new entry.
+# When the entries take more than "max_bytes", the least recently used ones are removed
+
+default_max_bytes = 1 << 30
+
+
+
+# file_hash
+# returns: the sha256 of the content of a file
+def file_hash(path):
+
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+
+    return sha.hexdigest()
+
+
+
+class PageTextCache:
+
+    # receives: the directory of the cache, the extractor (a function that receives the path of a pdf file and
+    # returns a generator of the text of each page), the version of the extractor and the maximum size of the
+    # cache (bytes)
+    def __init__(self, directory, extract, version, max_bytes=default_max_bytes):
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.__extract = extract
+        self.__version = re.sub('[^A-Za-z0-9.]+', '_', version)
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+
+    def __entry_path(self, sha256):
+        return os.path.join(self.directory, sha256 + '-' + self.__version + '.jsonl')
+
+
+    # pages
+    # receives: the path of a pdf file and, optionally, the sha256 of its content (computed otherwise)
+    # returns: a generator of the text of each page. On a miss, the pages are extracted as they are given and the
+    # entry is only saved after the last one, so a conversion that fails never leaves a partial entry
+    def pages(self, filePath, sha256=None):
+
+        if(sha256 == None):
+            sha256 = file_hash(filePath)
+        entry_path = self.__entry_path(sha256)
+
+        try:
+            f = open(entry_path, 'r', encoding='utf-8')
+        except FileNotFoundError:
+            f = None
+
+        if(f != None):
+            self.hits += 1
+            with f:
+                # the access time of the entries is their modification time, for the eviction
+                os.utime(entry_path)
+                for line in f:
+                    yield json.loads(line)
+            return
+
+        self.misses += 1
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f, contextlib.closing(self.__extract(filePath)) as pages:
+                for page in pages:
+                    f.write(json.dumps(page) + '\n')
+                    yield page
+            os.replace(tmp_path, entry_path)
+        finally:
+            if(os.path.exists(tmp_path)):
+                os.remove(tmp_path)
+
+        self.evict()
+
+
+    # evict
+    # removes the least recently used entries until the cache takes at most "max_bytes"
+    def evict(self):
+
+        entries = []
+        for name in os.listdir(self.directory):
+            if(name.endswith('.jsonl')):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, name in sorted(entries):
+            if(size <= self.max_bytes):
+                break
+            # another process may have removed it already
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                None
+            size -= entry_size
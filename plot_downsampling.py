@@ -0,0 +1,129 @@
+import numpy as np
+
+
+# This script was originaly created as part of the works on the creation of the CORAA dataset,
+# created to assist the training of portuguese automatic speech recognition tools
+
+# This script reduces the number of points of the scatter plots of the metrics scripts, which can have
+# hundreds of thousands of samples per series, to what can actually be seen at the resolution of the output.
+# Two methods are available:
+#   'minmax' - the x axis is split in one bin per pixel column and only the lowest and highest point of each
+#              bin are kept, plus one point per pixel where the curve is steep. At the output resolution the
+#              plot is the same as the one with all the points
+#   'lttb'   - Largest-Triangle-Three-Buckets, keeps the given number of points that best preserve the
+#              shape of the curve
+# The metrics scripts can also keep all the points and only rasterize them ('raster'), or plot them as
+# they are ('full')
+
+modes = ['minmax', 'lttb', 'raster', 'full']
+
+
+
+# minmax_downsample
+# RECEIVES: the x and y arrays of a series (x in increasing order), the number of bins along x (pixel columns)
+# and, optionally, the number of bins along y (pixel rows)
+# RETURNS: the x and y arrays of the points kept: the first and last point of the series and the lowest and
+# highest point of each column, in order of x. If "y_bins" is given, one point of each (column, row) cell is
+# also kept, so the steep parts of the curve have no gaps between the lowest and highest point of a column
+def minmax_downsample(x, y, n_bins, y_bins=None):
+
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if(len(x) <= 2 * n_bins):
+        return x, y
+
+    # bin of each point, by its position along the x axis
+    bins = to_bins(x, n_bins)
+
+    # sorting by (bin, y) leaves the lowest point of each bin at its start and the highest at its end
+    order = np.lexsort((y, bins))
+    starts = np.flatnonzero(np.r_[True, bins[order][1:] != bins[order][:-1]])
+    ends = np.r_[starts[1:], len(order)] - 1
+
+    keep = [[0, len(x) - 1], order[starts], order[ends]]
+
+    if(y_bins != None):
+        cells = bins * y_bins + to_bins(y, y_bins)
+        keep.append(np.unique(cells, return_index=True)[1])
+
+    keep = np.unique(np.concatenate(keep))
+
+    return x[keep], y[keep]
+
+
+
+# to_bins
+# RECEIVES: an array of values and a number of bins
+# RETURNS: the bin of each value, splitting the range of the values in bins of the same size
+def to_bins(values, n_bins):
+
+    low = values.min()
+    span = values.max() - low
+    if(span <= 0):
+        return np.zeros(len(values), dtype=np.int64)
+
+    return np.minimum(((values - low) * (n_bins / span)).astype(np.int64), n_bins - 1)
+
+
+
+# lttb
+# Largest-Triangle-Three-Buckets downsampling (Steinarsson, 2013)
+# RECEIVES: the x and y arrays of a series (x in increasing order) and the number of points to keep
+# RETURNS: the x and y arrays of the points kept, always including the first and the last one
+def lttb(x, y, n_out):
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if(n_out >= n or n_out < 3):
+        return x, y
+
+    # the points between the first and the last are split in n_out-2 buckets, one point is kept from each
+    edges = (np.arange(n_out - 1) * (n - 2) / (n_out - 2)).astype(np.int64) + 1
+    edges[-1] = n - 1
+
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0] = 0
+    keep[-1] = n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+
+        # the third vertex of the triangles is the average point of the next bucket (the last point for the
+        # last bucket)
+        if(i < n_out - 3):
+            next_end = edges[i + 2]
+            cx = x[end:next_end].mean()
+            cy = y[end:next_end].mean()
+        else:
+            cx = x[-1]
+            cy = y[-1]
+
+        # keeps the point of the bucket that forms the largest triangle with the last point kept and the third vertex
+        areas = np.abs((x[a] - cx) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (cy - y[a]))
+        a = start + int(np.argmax(areas))
+        keep[i + 1] = a
+
+    return x[keep], y[keep]
+
+
+
+# downsample
+# RECEIVES: the x and y arrays of a series, the method ('minmax', 'lttb', or any other mode to keep all the
+# points) and the width and height of the plot area in pixels
+# RETURNS: the x and y arrays to be plotted
+def downsample(x, y, mode, width, height):
+
+    if(mode not in modes):
+        raise RuntimeError('Unknown plot mode \"' + str(mode) + '\" (expected one of ' + str(modes) + ')')
+
+    width = max(1, int(width))
+    height = max(1, int(height))
+
+    if(mode == 'minmax'):
+        return minmax_downsample(x, y, width, height)
+    if(mode == 'lttb'):
+        return lttb(x, y, 2 * width)
+
+    return np.asarray(x), np.asarray(y)
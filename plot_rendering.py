@@ -0,0 +1,134 @@
+import concurrent.futures
+import math
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.colors import LogNorm
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import plot_downsampling
+
+
+# This script was originaly created as part of the works on the creation of the CORAA dataset,
+# created to assist the training of portuguese automatic speech recognition tools
+
+# This script renders the sorted-distribution scatter plots of the metrics scripts, and the heat maps of the
+# joint distributions of the corpus profile (see "get_corpus_profile"). The figures are built
+# directly on the Agg backend, without pyplot, so no figure is kept in pyplot's global state: each one is
+# released as soon as it is saved. A list of plots (jobs) can be rendered by a pool of processes, each
+# job being a (title, series, labels) tuple, where "series" is a list of arrays and "labels" is a list with
+# the label of each array (or None)
+
+
+
+# render_scatter
+# Given a list of arrays (each array is plotted with a different color and label), sorts each array and
+# saves a scatter plot of them as "<output_dir>/<title>.png"
+# RECEIVES: a list of arrays, the title of the plot, the output directory, a list of labels for each plotted
+# array (or None), the label of the y axis and how the points are rendered (see "plot_downsampling")
+def render_scatter(series, title, output_dir, labels=None, ylabel='', mode='minmax'):
+
+    # for each array in the list, sorts the array
+    ds = [np.sort(np.asarray(values)) for values in series]
+
+    num_of_samples = 0
+    for values in ds:
+        num_of_samples = max(num_of_samples, len(values))
+
+    max_y_value = 0
+    for values in ds:
+        if(len(values) > 0):
+            max_y_value = max(max_y_value, values[-1])
+
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    try:
+        ax = fig.add_subplot(1, 1, 1)
+
+        y_tick = max(1, math.floor(max_y_value/10))
+        major_y_ticks = np.arange(0, max_y_value+1, y_tick)
+        minor_y_ticks = np.arange(0, max_y_value+1, y_tick/2)
+
+        major_x_ticks = np.arange(0, num_of_samples+1, max(1, num_of_samples/5))
+
+        ax.set_xticks(major_x_ticks)
+        ax.set_yticks(major_y_ticks)
+        ax.set_yticks(minor_y_ticks, minor=True)
+
+        ax.grid(which='both')
+        ax.grid(which='major', color='#3489ff')
+
+        # The arrays are sorted curves, so only the points that can be seen at the output resolution are plotted
+        extent = ax.get_window_extent()
+        for index, values in enumerate(ds):
+            x, y = plot_downsampling.downsample(np.arange(1, len(values)+1), values, mode, extent.width, extent.height)
+            if(labels != None):
+                ax.scatter(x, y, s=8, label=labels[index], rasterized=(mode == 'raster'))
+            else:
+                ax.scatter(x, y, s=8, rasterized=(mode == 'raster'))
+
+        if(labels != None):
+            ax.legend(loc='upper left', bbox_to_anchor=(1.05, 1), fancybox=True, shadow=True, ncol=1)
+        ax.set_title(title)
+        ax.set_xlabel('Nº da amostra')
+        ax.set_ylabel(ylabel)
+        fig.savefig(output_dir + '/' + title + '.png', bbox_inches='tight')
+
+    finally:
+        fig.clear()
+
+
+
+# render_histogram2d
+# saves the joint distribution of two values (e.g. duration and number of words of the audios) as a heat map,
+# "<output_dir>/<title>.png", with the number of samples of each cell in log scale (empty cells left blank)
+# RECEIVES: the counts of each cell (x bins by y bins) and the edges of the bins along x and y (as returned
+# by "np.histogram2d"), the title of the plot, the output directory and the labels of the x and y axes
+def render_histogram2d(counts, x_edges, y_edges, title, output_dir, xlabel='', ylabel=''):
+
+    counts = np.ma.masked_equal(np.asarray(counts).T, 0)
+
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    try:
+        ax = fig.add_subplot(1, 1, 1)
+
+        if(counts.count() > 0):
+            mesh = ax.pcolormesh(x_edges, y_edges, counts, norm=LogNorm(vmin=1, vmax=counts.max()))
+            fig.colorbar(mesh, ax=ax, label='Nº de amostras')
+
+        ax.set_xlim(x_edges[0], x_edges[-1])
+        ax.set_ylim(y_edges[0], y_edges[-1])
+        ax.set_title(title)
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(ylabel)
+        fig.savefig(output_dir + '/' + title + '.png', bbox_inches='tight')
+
+    finally:
+        fig.clear()
+
+
+
+# render_job
+# renders one (title, series, labels) job (see "render_scatter")
+def render_job(job, output_dir, ylabel, mode):
+
+    title, series, labels = job
+    render_scatter(series, title, output_dir, labels, ylabel, mode)
+
+    return title
+
+
+
+# render_jobs
+# Renders a list of plots, "workers" at a time (in separate processes when workers > 1)
+# RECEIVES: a list of (title, series, labels) jobs, the output directory, the label of the y axis, how the
+# points are rendered (see "plot_downsampling") and the number of processes
+# RETURNS: the list of titles rendered, in the order of the jobs
+def render_jobs(jobs, output_dir, ylabel='', mode='minmax', workers=1):
+
+    n = len(jobs)
+
+    if(workers > 1 and n > 1):
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, n)) as pool:
+            return list(pool.map(render_job, jobs, [output_dir] * n, [ylabel] * n, [mode] * n))
+
+    return [render_job(job, output_dir, ylabel, mode) for job in jobs]
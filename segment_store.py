@@ -0,0 +1,149 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+from sub_dataset_classifier import sub_datasets, get_sub_dataset_codes
+
+
+# This script was originaly created as part of the works on the creation of the CORAA dataset,
+# created to assist the training of portuguese automatic speech recognition tools
+
+# This script keeps a persistent, columnar store of the segments (audios) of the CORAA dataset: their file
+# path, sub-dataset code (see "sub_dataset_classifier"), duration and number of words. Each column is a ".npy"
+# file inside the store's directory, so the plots and stats can load only the columns they need, memory-mapped
+# (zero-copy).
+# The store is updated incrementally: segments already there are updated, new ones are appended, and the
+# values that are not known yet are kept as "unknown" (nan duration, -1 words).
+# Each update writes all the columns to a new version directory ("v...") inside the store's directory, and the
+# file "CURRENT" names the version in use. It is replaced in a single step, so an interrupted update leaves the
+# previous version whole, and the columns of a version always have the same number of rows
+
+
+
+class SegmentStore:
+
+    # name, dtype and "unknown" value of each column besides file_path
+    columns = {'subset': (np.int8, -1), 'duration': (np.float64, np.nan), 'words': (np.int32, -1)}
+
+    def __init__(self, directory):
+
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        lengths = {name: len(self.column(name)) for name in ['file_path'] + list(self.columns)}
+        if(len(set(lengths.values())) > 1):
+            raise RuntimeError('Segment store \"' + directory + '\" is inconsistent, its columns have different '
+                               'numbers of rows (' + str(lengths) + ')')
+
+
+    # current
+    # RETURNS: the directory of the version in use (the store's directory itself for the stores written
+    # before the versions, with the columns directly in it)
+    def __current(self):
+
+        try:
+            with open(os.path.join(self.directory, 'CURRENT'), 'r') as f:
+                return os.path.join(self.directory, f.read().strip())
+        except FileNotFoundError:
+            return self.directory
+
+
+    def __column_path(self, name):
+        return os.path.join(self.__current(), name + '.npy')
+
+
+    # column
+    # RECEIVES: the name of a column ('file_path', 'subset', 'duration' or 'words')
+    # RETURNS: the column as a read-only, memory-mapped array (empty if the store is empty)
+    def column(self, name):
+
+        if not os.path.exists(self.__column_path(name)):
+            dtype = 'S1' if name == 'file_path' else self.columns[name][0]
+            return np.empty(0, dtype=dtype)
+
+        return np.load(self.__column_path(name), mmap_mode='r')
+
+
+    # file_paths
+    # RETURNS: a list with the file path of every segment, in the order of the rows
+    def file_paths(self):
+        return [file_path.decode('utf-8') for file_path in self.column('file_path')]
+
+
+    # update
+    # Inserts new segments and updates the existing ones
+    # RECEIVES: a list of file paths and, for any of the columns, a list with the value of each file path.
+    # Unknown values (nan durations, negative number of words) never overwrite values already stored. The
+    # sub-dataset code is derived from the file path when it is not given
+    def update(self, file_paths, **values):
+
+        for name in values:
+            if name not in self.columns:
+                raise RuntimeError('Unknown column \"' + name + '\" (expected one of ' + str(list(self.columns)) + ')')
+
+        if('subset' not in values):
+            values['subset'] = get_sub_dataset_codes(file_paths)
+
+        stored_paths = self.file_paths()
+        rows = {file_path: i for i, file_path in enumerate(stored_paths)}
+
+        # gives a row to each new file path
+        for file_path in file_paths:
+            if(file_path not in rows):
+                rows[file_path] = len(stored_paths)
+                stored_paths.append(file_path)
+
+        indexes = np.array([rows[file_path] for file_path in file_paths], dtype=np.int64)
+
+        # loads each column in memory, growing it to the new number of rows, and writes the new values
+        new_columns = {}
+        for name, (dtype, unknown) in self.columns.items():
+
+            column = np.full(len(stored_paths), unknown, dtype=dtype)
+            old = self.column(name)
+            column[:len(old)] = old
+
+            if(name in values):
+                new = np.asarray(values[name], dtype=dtype)
+                known = ~np.isnan(new) if name == 'duration' else new >= 0
+                column[indexes[known]] = new[known]
+
+            new_columns[name] = column
+
+        new_columns['file_path'] = np.array([file_path.encode('utf-8') for file_path in stored_paths])
+
+        # all the columns are written to a new version, which becomes the current one when "CURRENT" is replaced
+        previous = self.__current()
+        version = tempfile.mkdtemp(prefix='v', dir=self.directory)
+        for name, column in new_columns.items():
+            np.save(os.path.join(version, name + '.npy'), column)
+
+        with open(os.path.join(self.directory, 'CURRENT.tmp'), 'w') as f:
+            f.write(os.path.basename(version))
+        os.replace(os.path.join(self.directory, 'CURRENT.tmp'), os.path.join(self.directory, 'CURRENT'))
+
+        # removes the previous version and the ones left by interrupted updates (columns already memory-mapped
+        # from them can still be read)
+        if(previous == self.directory):
+            for name in new_columns:
+                if(os.path.exists(os.path.join(self.directory, name + '.npy'))):
+                    os.remove(os.path.join(self.directory, name + '.npy'))
+        for entry in os.listdir(self.directory):
+            path = os.path.join(self.directory, entry)
+            if(entry.startswith('v') and os.path.isdir(path) and path != version):
+                shutil.rmtree(path, ignore_errors=True)
+
+
+    # select
+    # RECEIVES: the name of a column with numeric values ('duration' or 'words')
+    # RETURNS: a list with, for each sub-dataset (in the order of "sub_datasets"), an array with the known values
+    # of that column
+    def select(self, name):
+
+        values = self.column(name)
+        subsets = self.column('subset')
+        _, unknown = self.columns[name]
+        known = ~np.isnan(values) if name == 'duration' else values != unknown
+
+        return [np.asarray(values[known & (subsets == code)]) for code in range(len(sub_datasets))]
@@ -0,0 +1,72 @@
+import sys
+
+
+# This script was originaly created as part of the works on the creation of the CORAA dataset,
+# created to assist the training of portuguese automatic speech recognition tools
+
+# This script resolves values (durations, transcriptions, ...) of many audios with a few queries to the
+# database, each one with a chunk of file paths in an "IN (...)" list, instead of one query per audio.
+# It works with any DB-API connection (mysql.connector for CORAA's database, sqlite3 for local tests)
+
+
+
+# get_placeholder
+# RECEIVES: an open DB-API connection
+# RETURNS: the parameter placeholder used by its driver ("%s" for mysql.connector, "?" for sqlite3)
+def get_placeholder(connection):
+
+    module = type(connection).__module__
+    while(module != ''):
+        paramstyle = getattr(sys.modules.get(module), 'paramstyle', None)
+        if(paramstyle != None):
+            return '?' if paramstyle == 'qmark' else '%s'
+        module = module.rpartition('.')[0]
+
+    return '%s'
+
+
+
+# resolve_paths
+# Retrieves the value of each file path with queries over chunks of "chunk_size" paths
+# RECEIVES: an open DB-API connection, a query that returns (file_path, value) rows and has a "{}" where
+# the list of paths goes (e.g. "SELECT file_path, duration FROM ... WHERE file_path IN ({})"), the file
+# paths (repeated paths are queried only once), the number of paths per query and whether to print the progress.
+# The query may also return more than one value per path, e.g. (file_path, duration, transcription) rows
+# RETURNS: a dict where the key is the file path and the value is the first value returned for it (a tuple, if
+# the query returns more than one value), a list of the paths the database didn't return and a list of
+# (path, error) of the paths whose query failed
+def resolve_paths(connection, query, file_paths, chunk_size=1000, progress=False):
+
+    placeholder = get_placeholder(connection)
+    file_paths = list(dict.fromkeys(file_paths))
+
+    values = {}
+    errored = []
+
+    cursor = connection.cursor()
+
+    for start in range(0, len(file_paths), chunk_size):
+
+        if(progress):
+            print('Progress: ' + str(start) + ' of ' + str(len(file_paths)))
+
+        chunk = file_paths[start:start + chunk_size]
+
+        try:
+            cursor.execute(query.format(', '.join([placeholder] * len(chunk))), chunk)
+            rows = cursor.fetchall()
+        except Exception as e:
+            errored += [(file_path, str(e)) for file_path in chunk]
+            continue
+
+        for row in rows:
+            file_path = row[0]
+            if(file_path not in values):
+                values[file_path] = row[1] if len(row) == 2 else tuple(row[1:])
+
+    cursor.close()
+
+    failed = set(file_path for file_path, _ in errored)
+    missing = [file_path for file_path in file_paths if file_path not in values and file_path not in failed]
+
+    return values, missing, errored
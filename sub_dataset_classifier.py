@@ -0,0 +1,60 @@
+import re
+import numpy as np
+
+
+# This script was originaly created as part of the works on the creation of the CORAA dataset,
+# created to assist the training of portuguese automatic speech recognition tools
+
+# This is the classifier that tells to which sub-dataset of CORAA (ALIP, TED, NURC-Recife, Coral Brasil or
+# SP-2010) an audio belongs, based on its file path. It is shared by all the scripts, so they all agree on
+# the buckets. The patterns of all the sub-datasets are compiled in a single regex, and whole arrays of
+# paths are classified at once into compact int8 codes
+
+sub_datasets = ['ALIP', 'TED', 'NURC_RE', 'CORAL', 'SP2010']   # the code of each one is its index
+unknown = -1                                                    # code of the paths that match no sub-dataset
+
+# pattern of each sub-dataset, in order of priority (the first one found in a path decides its sub-dataset)
+patterns = [('ALIP', 'alip'), ('NURC_RE', 'NURC_RE'), ('TED', 'Ted_'), ('CORAL', 'CORAL|_CO_'), ('SP2010', r'_sp_\.')]
+
+# each alternative looks ahead through the whole path for one pattern, so the alternatives are tried in order of
+# priority and the name of the group that matched ("lastgroup") is the sub-dataset
+__regex = re.compile('|'.join('(?=.*?(?P<' + name + '>' + pattern + '))' for name, pattern in patterns), re.S)
+__codes = {name: np.int8(code) for code, name in enumerate(sub_datasets)}
+
+
+
+# get_sub_dataset
+# RECEIVES: a file path
+# RETURNS: the name of its sub-dataset (see "sub_datasets"), or None if it didn't match any of them
+def get_sub_dataset(file_path):
+
+    match = __regex.match(file_path)
+    if(match == None):
+        return None
+
+    return match.lastgroup
+
+
+
+# get_sub_dataset_code
+# RECEIVES: a file path
+# RETURNS: the code of its sub-dataset (its index in "sub_datasets"), or -1 if it didn't match any of them
+def get_sub_dataset_code(file_path):
+
+    match = __regex.match(file_path)
+    if(match == None):
+        return unknown
+
+    return __codes[match.lastgroup]
+
+
+
+# get_sub_dataset_codes
+# RECEIVES: an iterable of file paths
+# RETURNS: an int8 array with the code of each path (see "get_sub_dataset_code")
+def get_sub_dataset_codes(file_paths):
+
+    match = __regex.match
+    codes = __codes
+
+    return np.fromiter(((codes[m.lastgroup] if m != None else unknown) for m in map(match, file_paths)), dtype=np.int8)
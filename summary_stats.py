@@ -0,0 +1,234 @@
+import json
+import math
+import os
+import numpy as np
+
+
+# This script was originaly created as part of the works on the creation of the CORAA dataset,
+# created to assist the training of portuguese automatic speech recognition tools
+
+# This script computes the summary stats of the metrics scripts (number of samples, total, mean, standard
+# deviation, min, max and any quantiles) with NumPy, in a single pass over each group of values.
+# For inputs that don't fit in memory, the values can be given in chunks to a "StreamingSummary": the
+# count, total, mean and deviation are still exact, and the quantiles are estimated by a KLL sketch
+# (Karnin, Lang and Liberty, 2016) that keeps only a few thousand values.
+# The summaries can be saved as json ("infos.json"), next to the "infos.txt" files of the metrics scripts
+
+default_quantiles = [25, 50, 75]
+
+
+
+# summarize
+# RECEIVES: an array of values, the quantiles to be computed (in percent) and, optionally, whether the
+# quantiles should be estimated by a sketch instead of computed exactly (the values are then read in chunks,
+# so memory-mapped arrays are never fully loaded)
+# RETURNS: a dict with the count, total, mean, std (sample standard deviation), min, max and a dict with
+# each quantile
+def summarize(values, quantiles=default_quantiles, sketch=False, chunk_size=1000000):
+
+    if(sketch):
+        summary = StreamingSummary()
+        for start in range(0, len(values), chunk_size):
+            summary.update(values[start:start+chunk_size])
+        return summary.summary(quantiles)
+
+    values = np.asarray(values)
+    count = len(values)
+    if(count == 0):
+        return empty_summary(quantiles)
+
+    total = values.sum()
+    mean = total / count
+    std = math.sqrt(np.square(values - mean).sum() / (count - 1)) if count > 1 else math.nan
+    q_values = np.percentile(values, quantiles)
+
+    return {
+        'count': count,
+        'total': total.item(),
+        'mean': mean.item(),
+        'std': std,
+        'min': values.min().item(),
+        'max': values.max().item(),
+        'quantiles': {str(q): v.item() for q, v in zip(quantiles, q_values)}
+    }
+
+
+
+# empty_summary
+# RETURNS: the summary of a group with no values
+def empty_summary(quantiles=default_quantiles):
+
+    return {'count': 0, 'total': 0, 'mean': math.nan, 'std': math.nan, 'min': math.nan, 'max': math.nan,
+            'quantiles': {str(q): math.nan for q in quantiles}}
+
+
+
+# QuantileSketch
+# a KLL sketch: the values are kept in levels of "compactors", where each value of level h stands for 2^h
+# values of the input. When a level gets bigger than its capacity, it is sorted and every other value
+# (starting at a random one) is promoted to the level above, so the sketch keeps O(k log(n/k)) values
+# and the rank error of the quantiles is about 1.7/k
+class QuantileSketch:
+
+    def __init__(self, k=200, seed=None):
+
+        self.k = k
+        self.count = 0
+        self.__levels = [np.empty(0)]
+        self.__rng = np.random.default_rng(seed)
+
+
+    def __capacity(self, level):
+        return max(2, int(math.ceil(self.k * (2/3) ** (len(self.__levels) - 1 - level))))
+
+
+    def __compress(self):
+
+        level = 0
+        while level < len(self.__levels):
+            items = self.__levels[level]
+            if(len(items) > self.__capacity(level)):
+
+                items = np.sort(items)
+                # an odd value stays behind, so every promoted value stands for exactly two
+                kept, items = items[:len(items) % 2], items[len(items) % 2:]
+                promoted = items[self.__rng.integers(2)::2]
+
+                self.__levels[level] = kept
+                if(level + 1 == len(self.__levels)):
+                    self.__levels.append(np.empty(0))
+                self.__levels[level + 1] = np.concatenate((self.__levels[level + 1], promoted))
+
+                # adding a level lowers the capacity of the others, so they are checked again from the bottom
+                level = 0
+                continue
+
+            level += 1
+
+
+    # update
+    # RECEIVES: an array of values to be added to the sketch
+    def update(self, values):
+
+        values = np.asarray(values, dtype=np.float64).ravel()
+        self.count += len(values)
+        self.__levels[0] = np.concatenate((self.__levels[0], values))
+        self.__compress()
+
+
+    # merge
+    # Adds all the values of another sketch to this one (e.g. one sketch per chunk or process)
+    def merge(self, other):
+
+        for level, items in enumerate(other.__levels):
+            if(level == len(self.__levels)):
+                self.__levels.append(np.empty(0))
+            self.__levels[level] = np.concatenate((self.__levels[level], items))
+
+        self.count += other.count
+        self.__compress()
+
+
+    # quantiles
+    # RECEIVES: a list of quantiles (in percent)
+    # RETURNS: an array with the estimate of each quantile
+    def quantiles(self, quantiles):
+
+        if(self.count == 0):
+            return np.full(len(quantiles), math.nan)
+
+        items = np.concatenate(self.__levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** level) for level, items in enumerate(self.__levels)])
+
+        order = np.argsort(items, kind='stable')
+        items = items[order]
+        ranks = np.cumsum(weights[order])
+
+        targets = np.asarray(quantiles, dtype=np.float64) / 100 * ranks[-1]
+        return items[np.minimum(np.searchsorted(ranks, targets), len(items) - 1)]
+
+
+
+# StreamingSummary
+# the summary of values that are given in chunks. The count, total, mean, std, min and max are exact (the
+# chunks are combined with Chan's parallel algorithm), the quantiles are estimated by a "QuantileSketch"
+class StreamingSummary:
+
+    def __init__(self, k=200, seed=None):
+
+        self.count = 0
+        self.total = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sketch = QuantileSketch(k, seed)
+
+
+    # update
+    # RECEIVES: an array with the next chunk of values
+    def update(self, values):
+
+        values = np.asarray(values)
+        count = len(values)
+        if(count == 0):
+            return
+
+        total = values.sum().item()
+        mean = total / count
+        m2 = np.square(values - mean).sum().item()
+
+        delta = mean - self.mean
+        new_count = self.count + count
+        self.m2 += m2 + delta * delta * self.count * count / new_count
+        self.mean += delta * count / new_count
+        self.count = new_count
+        self.total += total
+        self.min = min(self.min, values.min().item())
+        self.max = max(self.max, values.max().item())
+
+        self.sketch.update(values)
+
+
+    # summary
+    # RECEIVES: the quantiles to be estimated (in percent)
+    # RETURNS: a dict in the same format as the one returned by "summarize"
+    def summary(self, quantiles=default_quantiles):
+
+        if(self.count == 0):
+            return empty_summary(quantiles)
+
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count,
+            'std': math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else math.nan,
+            'min': self.min,
+            'max': self.max,
+            'quantiles': {str(q): v.item() for q, v in zip(quantiles, self.sketch.quantiles(quantiles))}
+        }
+
+
+
+# write_summaries
+# Saves summaries as json. Values that are not defined (e.g. the std of a single value) are saved as null
+# RECEIVES: the path of the json file and a dict where the key is a title and the value is its summary.
+# If the file already exists, the titles are added to it (replacing the ones with the same title)
+def write_summaries(path, summaries):
+
+    def defined(value):
+        if(isinstance(value, dict)):
+            return {key: defined(v) for key, v in value.items()}
+        if(isinstance(value, float) and math.isnan(value)):
+            return None
+        return value
+
+    stored = {}
+    if(os.path.exists(path)):
+        with open(path, 'r') as f:
+            stored = json.load(f)
+
+    stored.update({title: defined(summary) for title, summary in summaries.items()})
+
+    with open(path, 'w') as f:
+        json.dump(stored, f, indent=4, ensure_ascii=False)
@@ -0,0 +1,81 @@
+import random
+import jiwer
+import textdistance
+import bit_parallel_levenshtein
+
+
+# This script was originaly created as part of the works on the creation of the CORAA dataset,
+# created to assist the training of portuguese automatic speech recognition tools
+
+# This script checks that "bit_parallel_levenshtein" gives the same values as the libraries it replaced:
+# textdistance (distance and normalized similarity of the transcriptions) and jiwer (WER, as the word distance
+# divided by the number of reference words). It can be run directly or by pytest
+
+alphabet = 'aabcdeé ç'
+words = ['a', 'casa', 'é', 'de', 'que', 'não', 'eu', 'ele', '###', 'coisa']
+
+
+
+# random_text
+# RETURNS: a random string, short most of the time, sometimes longer than a machine word (64 chars)
+def random_text(rng):
+
+    length = rng.choice([0, 1, 2, 5, 10, 30, 63, 64, 65, 150])
+    return ''.join(rng.choice(alphabet) for _ in range(length))
+
+
+def random_words(rng, min_words=0):
+    return [rng.choice(words) for _ in range(rng.randint(min_words, 40))]
+
+
+def test_distance_and_similarity():
+
+    rng = random.Random(0)
+    for _ in range(3000):
+        s1 = random_text(rng)
+        s2 = random_text(rng) if rng.random() < 0.5 else ''.join(c for c in s1 if rng.random() < 0.9)
+
+        distance = textdistance.levenshtein.distance(s1, s2)
+        similarity = textdistance.levenshtein.normalized_similarity(s1, s2)
+
+        assert bit_parallel_levenshtein.levenshtein_distance(s1, s2) == distance
+        assert bit_parallel_levenshtein.normalized_similarity(s1, s2) == similarity
+
+        # the cutoffs only change the values beyond them
+        max_distance = rng.randint(0, 10)
+        assert bit_parallel_levenshtein.levenshtein_distance(s1, s2, max_distance) == min(distance, max_distance + 1)
+        min_similarity = rng.random()
+        expected = similarity if similarity >= min_similarity else 0
+        assert bit_parallel_levenshtein.normalized_similarity(s1, s2, min_similarity) == expected
+
+
+def test_batch():
+
+    rng = random.Random(1)
+    pairs = [(random_text(rng), random_text(rng)) for _ in range(500)]
+
+    assert bit_parallel_levenshtein.batch_normalized_similarity(pairs) == \
+        [textdistance.levenshtein.normalized_similarity(s1, s2) for s1, s2 in pairs]
+
+
+def test_word_error_rate():
+
+    rng = random.Random(2)
+    for _ in range(2000):
+        ref = random_words(rng, min_words=1)
+        hyp = random_words(rng) if rng.random() < 0.5 else [w for w in ref if rng.random() < 0.8]
+
+        wer = bit_parallel_levenshtein.levenshtein_distance(ref, hyp) / len(ref)
+        assert abs(wer - jiwer.wer(' '.join(ref), ' '.join(hyp))) < 1e-12
+
+
+
+
+
+
+# Main code-------------------------------------------------------
+if __name__ == '__main__':
+    test_distance_and_similarity()
+    test_batch()
+    test_word_error_rate()
+    print('ok')
@@ -0,0 +1,113 @@
+import gzip
+import os
+import sys
+import tempfile
+import numpy as np
+import csv_ingest
+
+
+# This script was originaly created as part of the works on the creation of the CORAA dataset,
+# created to assist the training of portuguese automatic speech recognition tools
+
+# This script checks that the two backends of "csv_ingest" (pyarrow and the csv module) read the same columns,
+# including the old exports, whose transcriptions have unquoted commas (rows with more fields than the others).
+# It can be run directly or by pytest
+
+
+
+# an export with a header, quoted fields and, after the first few thousand rows, rows with unquoted commas
+def write_export(directory, ragged_from=5000, rows=20000):
+
+    lines = ['file_path,duration,text,votes,task,subset']
+    lines.append('wavs/ALIP/a_ALIP.wav,1.5,"quoted, text",3,ok,alip')
+    for i in range(1, rows):
+        text = 'um, dois, tres' if i >= ragged_from and i % 7 == 0 else 'texto ' + str(i)
+        lines.append('wavs/TED/t' + str(i) + '_Ted_.wav,' + str(i / 4) + ',' + text + ',' + str(i % 4) + ',ok,ted')
+    data = '\n'.join(lines) + '\n\n'
+
+    path = os.path.join(directory, 'export.csv')
+    with open(path, 'w') as f:
+        f.write(data)
+    with gzip.open(path + '.gz', 'wt') as f:
+        f.write(data)
+
+    return path
+
+
+# read_with_csv_module
+# reads the columns with the csv module backend, as when pyarrow is not installed
+def read_with_csv_module(*args, **kwargs):
+
+    arrow = sys.modules.get('pyarrow.csv')
+    sys.modules['pyarrow.csv'] = None
+    try:
+        return csv_ingest.read_columns(*args, **kwargs)
+    finally:
+        if(arrow == None):
+            del sys.modules['pyarrow.csv']
+        else:
+            sys.modules['pyarrow.csv'] = arrow
+
+
+def assert_same_columns(a, b):
+
+    assert len(a) == len(b)
+    for x, y in zip(a, b):
+        assert x.dtype == y.dtype
+        assert np.array_equal(x, y)
+
+
+def test_ragged_rows():
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = write_export(directory)
+        columns = [0, 1, 3]
+
+        expected = read_with_csv_module(path, columns, header=True, types={0: str})
+        assert len(expected[0]) == 20000
+
+        # the ragged rows are found after some chunks were already read by pyarrow (only the columns with the
+        # same type in every chunk are compared, as the types inferred may change from a chunk to another)
+        types = {0: str, 1: np.float64}
+        chunks = list(csv_ingest.iter_columns(path, [0, 1], header=True, types=types, chunk_size=1 << 12))
+        assert len(chunks) > 2
+        for i, values in enumerate(read_with_csv_module(path, [0, 1], header=True, types=types)):
+            assert np.concatenate([chunk[i] for chunk in chunks]).tolist() == values.tolist()
+
+        assert_same_columns(expected, csv_ingest.read_columns(path, columns, header=True, types={0: str}))
+        assert_same_columns(expected, csv_ingest.read_columns(path + '.gz', columns, header=True, types={0: str}))
+
+        # a source that can't be read again (as the standard input)
+        r, w = os.pipe()
+        with open(path, 'rb') as f:
+            data = f.read()
+        if(os.fork() == 0):
+            os.close(r)
+            os.write(w, data)
+            os._exit(0)
+        os.close(w)
+        with os.fdopen(r, 'rb') as pipe:
+            assert_same_columns(expected, csv_ingest.read_columns(pipe, columns, header=True, types={0: str}))
+        os.wait()
+
+
+def test_quoted_fields():
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = write_export(directory, ragged_from=20000)
+        columns = ['file_path', 'text', 'votes']
+
+        expected = read_with_csv_module(path, columns, header=True)
+        assert expected[1][0] == 'quoted, text'
+        assert_same_columns(expected, csv_ingest.read_columns(path, columns, header=True))
+
+
+
+
+
+
+# Main code-------------------------------------------------------
+if __name__ == '__main__':
+    test_ragged_rows()
+    test_quoted_fields()
+    print('ok')
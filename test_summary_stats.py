@@ -0,0 +1,109 @@
+import json
+import math
+import os
+import tempfile
+import numpy as np
+import summary_stats
+
+
+# This script was originaly created as part of the works on the creation of the CORAA dataset,
+# created to assist the training of portuguese automatic speech recognition tools
+
+# This script checks the stats of "summary_stats" against NumPy: the exact summary, the moments of the
+# streaming summary (exact too) and the quantiles of the KLL sketch, which must be within its rank error of
+# "numpy.percentile". It can be run directly or by pytest
+
+quantiles = [1, 10, 25, 50, 75, 90, 99]
+
+# maximum rank error accepted for the sketch with the default k (about 1.7/k expected)
+max_rank_error = 0.02
+
+
+
+def datasets():
+
+    rng = np.random.default_rng(0)
+    return [rng.exponential(5, 200000), rng.normal(10, 3, 50000), rng.integers(0, 50, 100000).astype(float),
+            np.sort(rng.uniform(0, 1, 80000)), np.arange(1000, dtype=float)]
+
+
+def assert_moments(summary, values):
+
+    assert summary['count'] == len(values)
+    assert math.isclose(summary['total'], values.sum(), rel_tol=1e-9)
+    assert math.isclose(summary['mean'], values.mean(), rel_tol=1e-9)
+    assert math.isclose(summary['std'], values.std(ddof=1), rel_tol=1e-9)
+    assert summary['min'] == values.min()
+    assert summary['max'] == values.max()
+
+
+# rank_error
+# RETURNS: how far (as a fraction of the number of values) the rank of an estimate is from the quantile
+def rank_error(values, estimate, quantile):
+
+    values = np.sort(values)
+    low = np.searchsorted(values, estimate, side='left') / len(values)
+    high = np.searchsorted(values, estimate, side='right') / len(values)
+    target = quantile / 100
+
+    return max(0, low - target, target - high)
+
+
+def test_exact_summary():
+
+    for values in datasets():
+        summary = summary_stats.summarize(values, quantiles)
+        assert_moments(summary, values)
+        for q, expected in zip(quantiles, np.percentile(values, quantiles)):
+            assert summary['quantiles'][str(q)] == expected
+
+
+def test_sketch():
+
+    for values in datasets():
+        summary = summary_stats.summarize(values, quantiles, sketch=True, chunk_size=7919)
+        assert_moments(summary, values)
+        for q in quantiles:
+            assert rank_error(values, summary['quantiles'][str(q)], q) <= max_rank_error
+
+
+def test_merged_sketches():
+
+    values = datasets()[0]
+    sketches = [summary_stats.QuantileSketch(seed=i) for i in range(4)]
+    for i, sketch in enumerate(sketches):
+        sketch.update(values[i::4])
+    for sketch in sketches[1:]:
+        sketches[0].merge(sketch)
+
+    assert sketches[0].count == len(values)
+    for q, estimate in zip(quantiles, sketches[0].quantiles(quantiles)):
+        assert rank_error(values, estimate, q) <= max_rank_error
+
+
+def test_empty_and_json():
+
+    assert summary_stats.summarize(np.empty(0))['count'] == 0
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'infos.json')
+        summary_stats.write_summaries(path, {'a': summary_stats.summarize([1.0])})
+        summary_stats.write_summaries(path, {'b': summary_stats.summarize(np.empty(0))})
+        with open(path) as f:
+            stored = json.load(f)
+
+    assert stored['a']['std'] == None and stored['a']['mean'] == 1.0
+    assert stored['b']['quantiles']['50'] == None
+
+
+
+
+
+
+# Main code-------------------------------------------------------
+if __name__ == '__main__':
+    test_exact_summary()
+    test_sketch()
+    test_merged_sketches()
+    test_empty_and_json()
+    print('ok')
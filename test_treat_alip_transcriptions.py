@@ -0,0 +1,82 @@
+import random
+import re
+import unicodedata
+from treat_alip_transcriptions import AlipTranscriptConverter
+
+
+# This script was originaly created as part of the works on the creation of the CORAA dataset,
+# created to assist the training of portuguese automatic speech recognition tools
+
+# This script checks that the single-pass steps of the ALIP cleanup give the same text as the first versions of
+# the script: the expansion of single letters (one "re.sub" over the text for each single letter token), the
+# normalization of stage 8 and the removal of the chars out of the vocabulary of stage 13 (a regex substitution).
+# It can be run directly or by pytest
+
+converter = AlipTranscriptConverter()
+
+std_alphabet = 'abcdefghijklmnopqrstuvwxyzç'
+letters_in_full = ['a','bê','cê','dê','e','éfe','gê','agá','i','jota','cá','éle','eme','ene','o','pê','quê','érre',
+    'ésse','tê','u','vê','dáblio','xis','ípsilom','zê', 'c cedilha']
+
+fragments = [' ', ' ', '  ', '\n', 'c', 'ç', 'a', 'b', 'x', 'z', 'cç', 'Ç', 'é', 'casa', 'você', 'A.', '\t', 'e', 'o',
+             '1990', '$', 'à', 'é', '((', '–', '-', "'", '.', '/']
+
+
+
+# expand_letters
+# the letter expansion of the first versions of the script
+def expand_letters(text):
+
+    single_letters = [s for s in text.split() if len(s) == 1 and s in std_alphabet]
+
+    for letter in single_letters:
+        text = re.sub(' ' + letter + ' ', ' ' + letters_in_full[std_alphabet.index(letter)] + ' ', text)
+
+    return text
+
+
+# strip_accents
+# stage 8 of the first versions of the script
+def strip_accents(text):
+
+    accents = ('COMBINING ACUTE ACCENT', 'COMBINING GRAVE ACCENT')
+    chars = [c for c in unicodedata.normalize('NFD', text) if c not in accents]
+    return unicodedata.normalize('NFC', ''.join(chars))
+
+
+def random_text(rng):
+    return ''.join(rng.choice(fragments) for _ in range(rng.randint(0, 60)))
+
+
+def test_expand_letters():
+
+    rng = random.Random(0)
+    for _ in range(20000):
+        text = random_text(rng)
+        assert converter._AlipTranscriptConverter__expand_letters(text) == expand_letters(text)
+
+    # long runs of the same letters, where a replacement creates new ones (ç becomes "c cedilha")
+    for text in [' c c c ', ' ç ç ç ç ', ' ç c ç c c ç ', ' a a a b b ', ' ç' * 50 + ' ', ' c ç' * 30 + ' ']:
+        assert converter._AlipTranscriptConverter__expand_letters(text) == expand_letters(text)
+
+
+def test_normalize_and_vocabulary():
+
+    vocabulary = re.compile('[^{}]'.format(converter._AlipTranscriptConverter__case_sens_vocab))
+
+    rng = random.Random(1)
+    for _ in range(5000):
+        text = random_text(rng) + ''.join(chr(rng.randint(0, 0x2100)) for _ in range(rng.randint(0, 10)))
+        assert converter._AlipTranscriptConverter__normalize(text, 'censo') == strip_accents(text)
+        assert converter._AlipTranscriptConverter__filter_vocab(text, 'censo') == vocabulary.sub('', text)
+
+
+
+
+
+
+# Main code-------------------------------------------------------
+if __name__ == '__main__':
+    test_expand_letters()
+    test_normalize_and_vocabulary()
+    print('ok')
@@ -0,0 +1,60 @@
+import functools
+import re
+
+
+# This script was originaly created as part of the works on the creation of the CORAA dataset,
+# created to assist the training of portuguese automatic speech recognition tools
+
+# This is the normalization and tokenization layer used when comparing transcriptions.
+# Each distinct text goes through the normalization pipeline only once (results are kept in an LRU cache),
+# and its words are mapped to integer ids from a vocabulary shared by all the texts, so alignments
+# (e.g. bit_parallel_levenshtein) compare ints instead of strings.
+# With the default options, the words are the same ones jiwer uses to compute the WER.
+
+
+
+class TranscriptTokenizer:
+
+    __multiple_spaces = re.compile(r'\s\s+')
+    __punctuation = re.compile(r'[^\w\s\-\']')
+    __unintelligible = re.compile(r'#{3,}')
+
+    # RECEIVES: the steps of the pipeline to be applied besides the whitespace normalization (lowercasing,
+    # removal of punctuation, removal of the "###" unintelligible markers) and the size of the caches
+    def __init__(self, lowercase=False, remove_punctuation=False, drop_unintelligible=False, cache_size=65536):
+
+        self.lowercase = lowercase
+        self.remove_punctuation = remove_punctuation
+        self.drop_unintelligible = drop_unintelligible
+        self.vocabulary = {}
+
+        self.normalize = functools.lru_cache(maxsize=cache_size)(self.__normalize)
+        self.tokenize = functools.lru_cache(maxsize=cache_size)(self.__tokenize)
+
+
+    # normalize
+    # receives: a text
+    # returns: the list of its words, after going through the normalization pipeline
+    def __normalize(self, text):
+
+        text = text.replace('\n', '')
+
+        if(self.drop_unintelligible):
+            text = self.__unintelligible.sub(' ', text)
+        if(self.lowercase):
+            text = text.lower()
+        if(self.remove_punctuation):
+            text = self.__punctuation.sub('', text)
+
+        text = self.__multiple_spaces.sub(' ', text).strip()
+
+        return tuple(word for word in text.split(' ') if len(word) > 0)
+
+
+    # tokenize
+    # receives: a text
+    # returns: a tuple with the id of each of its normalized words
+    def __tokenize(self, text):
+
+        vocabulary = self.vocabulary
+        return tuple(vocabulary.setdefault(word, len(vocabulary)) for word in self.normalize(text))
@@ -1,5 +1,13 @@
 import PyPDF2
+from pdf_page_cache import PageTextCache, default_max_bytes, file_hash
+import concurrent.futures
+import contextlib
+import glob
+import json
+import os
 import re
+import sys
+import time
 import unicodedata
 
 
@@ -13,6 +21,43 @@ import unicodedata
 # specified in the sub-dataset description. It generates as output an txt file with the transcription text
 # cleaned, normalized, separeted by sentense and stripped of any headers, footers and other markers present
 # on the original pdf file
+# Whole directories of transcriptions can be converted at once, by a pool of processes, with the
+# "convert_transcripts" function (see below)
+
+
+
+# compile_stages
+# compiles a table of cleanup stages (see "AlipTranscriptConverter.__stages")
+# receives: a list of (name, fused, operations) stages
+# returns: a list of (name, operations) stages, where the substitutions are (compiled regex, replacement) tuples.
+# In fused stages, adjacent substitutions with the same replacement are joined into a single alternation
+def compile_stages(stages):
+
+    compiled = []
+
+    for name, fused, operations in stages:
+
+        groups = []
+        for operation in operations:
+            if(fused and not callable(operation) and len(groups) > 0 and not callable(groups[-1])
+               and groups[-1][1] == operation[1]):
+                groups[-1] = (groups[-1][0] + [operation[0]], operation[1])
+            elif(callable(operation)):
+                groups.append(operation)
+            else:
+                groups.append(([operation[0]], operation[1]))
+
+        for i, operation in enumerate(groups):
+            if(not callable(operation)):
+                patterns, replacement = operation
+                if(len(patterns) > 1):
+                    groups[i] = (re.compile('|'.join('(?:' + pattern + ')' for pattern in patterns)), replacement)
+                else:
+                    groups[i] = (re.compile(patterns[0]), replacement)
+
+        compiled.append((name, groups))
+
+    return compiled
 
 
 
@@ -22,54 +67,59 @@ class AlipTranscriptConverter:
     __vocab='abcdefghijklmnopqrstuvwxyzçãàáâêéíóôõúû\-\'\n '
     __case_sens_vocab='ABCDEFGHIJKLMNOPQRSTUVWXYZÇÃÀÁÂÊÉÍÓÔÕÚÛabcdefghijklmnopqrstuvwxyzçãàáâêéíóôõúû\-\'\n\./ '
 
-    #is_single_letter
-    #receives: a string
-    #returns: True if the string is a single letter and that is part of the standard alfabet. False if otherwise
-    def __is_single_letter(self, letter):
-
-        if(len(letter) == 1 and letter in self.__std_alphabet):
-            return True
-        
-        return False
+    # __VocabTable
+    # a translation table (for "str.translate") that keeps the chars of "__case_sens_vocab" and deletes all the
+    # others. The table is filled as the chars are found, deciding each one with the same char class the cleanup
+    # used as a regex
+    class __VocabTable(dict):
 
+        def __init__(self, vocab):
+            self.outside = re.compile('[^{}]'.format(vocab))
 
-    #expand_letter
-    #receives: a string
-    #returns: the letter equivalent in full
-    #throws an error if the string is more than a single char or if the char is not an alfabetic letter
-    def __expand_letter(self, letter):
-
-        vet = ['a','bê','cê','dê','e','éfe','gê','agá','i','jota','cá','éle','eme','ene','o','pê','quê','érre',
-        'ésse','tê','u','vê','dáblio','xis','ípsilom','zê', 'c cedilha']
+        def __missing__(self, key):
+            self[key] = None if self.outside.match(chr(key)) else key
+            return self[key]
 
-        if(len(letter) > 1):
-            raise NameError('Error in \'expand_letter\', passed value must be a single character')
-            return
+    __vocab_table = __VocabTable(__case_sens_vocab)
 
-        if(ord(letter) < 97):
-            raise NameError('Error in \'expand_letter\', passed value is not a valid letter')
-            return
 
-        if(letter == 'ç'):
-            return vet[len(vet) - 1]
+    # each letter of the standard alfabet in full
+    __letters_in_full = ['a','bê','cê','dê','e','éfe','gê','agá','i','jota','cá','éle','eme','ene','o','pê','quê','érre',
+        'ésse','tê','u','vê','dáblio','xis','ípsilom','zê', 'c cedilha']
+    __expanded = dict(zip(__std_alphabet, __letters_in_full))
 
-        return vet[ord(letter) - 97]
+    __spaced_letter = re.compile('(?<= )[abd-z](?= )')      # single letters between spaces, but c and ç
+    __c_token = re.compile('(?<!\S)[cç](?!\S)')             # c and ç tokens (between any whitespaces)
+    __spaced = {'c': re.compile(' c '), 'ç': re.compile(' ç ')}
 
-        
     #expand_letters
     #given a line, replaces single letters by its full equivalent
     #receives: a string
     #returns: a copy of the string, with single letters expanded
+    # The result is the same as replacing " <letter> " by " <letter in full> " once for each single letter token
+    # of the text (duplicates included, in order), but with a few passes over the text instead of one per token:
+    #   - a letter between spaces never becomes (or stops being) another letter between spaces, so all the
+    #     letters but c and ç are expanded at once, through a lookup table
+    #   - ç becomes "c cedilha", a new c, so c and ç are still replaced in the order of their tokens, skipping
+    #     the replacements that can't change anything: after two replacements of the same letter in a row,
+    #     or two replacements of ç, there is no occurrence of it between spaces left
     def __expand_letters(self, text):
 
-        vet = []
+        replacements = []
+        cedilla_replacements = 0
+        for token in self.__c_token.findall(text):
+            if(token == 'ç'):
+                if(cedilla_replacements == 2):
+                    continue
+                cedilla_replacements += 1
+            if(replacements[-2:] == [token, token]):
+                continue
+            replacements.append(token)
 
-        for s in text.split():
-            if(self.__is_single_letter(s)):
-                vet.append(s)
+        text = self.__spaced_letter.sub(lambda m: self.__expanded[m.group(0)], text)
 
-        for letter in vet:
-            text = re.sub(' ' + letter + ' ', ' ' + self.__expand_letter(letter) + ' ', text)
+        for letter in replacements:
+            text = self.__spaced[letter].sub(' ' + self.__expanded[letter] + ' ', text)
 
         return text
 
@@ -99,116 +149,475 @@ class AlipTranscriptConverter:
     # given a text following Alip notation, convets it to a single form of speech (formal or informal)
     # receives: the type of speech to be converted to (formal or informal); the text to be converted
     # return: the converted text
+    __mid_word_parenthesis = re.compile("(?<=[a-zA-ZÀ-û])\(([a-z]*)\)(?=[a-zA-ZÀ-û])")
+    __end_word_parenthesis = re.compile("([a-zA-ZÀ-û])\(([a-zA-ZÀ-û]*)\)")
+    __after_word_parenthesis = re.compile("(?<=[a-zA-ZÀ-û])\([a-z]+\)")
+    __before_word_parenthesis = re.compile("\([a-z]+\)(?=[a-zA-ZÀ-û]+)")
+
     def __convert_to_speech_type(self, type, text):
 
         if(type == 'form'):
             # remove mid word parenthesis
-            text = re.sub("(?<=[a-zA-ZÀ-û])\(([a-z]*)\)(?=[a-zA-ZÀ-û])", r"\1", text)
+            text = self.__mid_word_parenthesis.sub(r"\1", text)
             # remove end word parenthesis, remove accent
-            text = re.sub("([a-zA-ZÀ-û])\(([a-zA-ZÀ-û]*)\)", lambda m: self.__remove_accent(m.groups()[0]) + m.groups()[1], text)
+            text = self.__end_word_parenthesis.sub(lambda m: self.__remove_accent(m.groups()[0]) + m.groups()[1], text)
         else:
-            text = re.sub("(?<=[a-zA-ZÀ-û])\([a-z]+\)", "", text)
-            text = re.sub("\([a-z]+\)(?=[a-zA-ZÀ-û]+)", "", text)
+            text = self.__after_word_parenthesis.sub("", text)
+            text = self.__before_word_parenthesis.sub("", text)
 
         return text
 
 
-    def convert_transcript(self, filePath, output_dir, sample_type):
+    # the steps of the cleanup that are not simple substitutions. Each one receives the text and the type of
+    # the sample and returns the new text
 
-        global __case_sens_vocab
-        # 1-----------------------------------
-        # add all pdf pages
-        pdfFileObj = open(filePath, 'rb')
-        pdfReader = PyPDF2.PdfFileReader(pdfFileObj)
+    # 2 - removes everything before the beginning of the transcription ("\nNE\s*\n" for 'censo' samples),
+    # see "clean_pages"
+    __begin_markers = {'censo': re.compile("\n\s*NE\s*\n"), 'other': re.compile("Fernanda Maria Candido[\s\n]*")}
 
-        num_of_pages = pdfReader.getNumPages()
+    def __begin_marker(self, sample_type):
+        return self.__begin_markers['censo' if sample_type == 'censo' else 'other']
 
-        raw_text = ""
-        for page in range(num_of_pages):
-            pageObj = pdfReader.getPage(page)
-            raw_text += pageObj.extractText()
+    # 6 - removes the first char (the break left by the first 'Doc.:' or 'Inf.:')
+    def __drop_first_char(self, raw_text, sample_type):
+        return raw_text[1:]
 
+    # 8 - normalize text and apply NFC
+    # (the accents are kept: the text used to be decomposed (NFD) and filtered by the names of the combining
+    # accents, which never match a char, before being composed again, the same as applying NFC directly)
+    def __normalize(self, raw_text, sample_type):
+        return unicodedata.normalize('NFC', raw_text)
 
-        # 2------------------------------------
-        # remove everything before "\nNE\s*\n"
-        begin_marker = ""
-        if(sample_type == 'censo'):
-            begin_marker = "\n\s*NE\s*\n"
-        else:
-            begin_marker = "Fernanda Maria Candido[\s\n]*"
-        raw_text = re.sub(begin_marker, "$$$", raw_text)
-        transcript_start_index = raw_text.find('$$$')
-        raw_text = raw_text[transcript_start_index+3:]
+    # 13 - remove the chars that are not in "__case_sens_vocab", in a single pass with a translation table
+    # (see "__VocabTable")
+    def __filter_vocab(self, raw_text, sample_type):
+        return raw_text.translate(self.__vocab_table)
 
-        # 3------------------------------------
+    # 12 - keep only informal notation
+    def __keep_informal(self, raw_text, sample_type):
+        return self.__convert_to_speech_type('form', raw_text)
+
+    # 14 - expand letters
+    def __expand_all_letters(self, raw_text, sample_type):
+        return self.__expand_letters(raw_text)
+
+
+    # The cleanup of the text extracted from the pdf, as ordered tables of stages. Each stage has a name,
+    # whether its substitutions can be fused and a list of operations: (pattern, replacement) substitutions
+    # or one of the steps above. When a stage is fused, its adjacent substitutions with the same replacement
+    # are compiled into a single alternation (tried in the order of the table), so the text is scanned once
+    # for all of them.
+    # The first stages only handle the lines of the text, so they run on a few pages at a time, as the pages
+    # are extracted (see "clean_pages"); the others run on the whole text
+    __page_stages = [
         # remove ("\nNR\s*\n" / "\nDE\s*\n" / "\nRP\s*\n" / "\nRO\s*\n")
-        raw_text = re.sub("\nNR\s*\n", "", raw_text)
-        raw_text = re.sub("\nDE\s*\n", "", raw_text)
-        raw_text = re.sub("\nRP\s*\n", "", raw_text)
-        raw_text = re.sub("\nRO\s*\n", "", raw_text)
+        ('3 speaker markers', True, [("\nNR\s*\n", ""), ("\nDE\s*\n", ""), ("\nRP\s*\n", ""), ("\nRO\s*\n", "")]),
 
-        # 4------------------------------------
         # remove "\n"
-        raw_text = re.sub("\n{1}", "", raw_text)
+        ('4 line breaks', False, [("\n{1}", "")]),
 
-        # 5------------------------------------
         # - remove "Projeto ALIP Œ Banco de dados IBORUNA\s*[0-9]*\s*"
-        raw_text = re.sub("Projeto ALIP\s*.{1} Banco de dados IBORUNA[0-9\s\.]*", "", raw_text)
+        ('5 page header', False, [("Projeto ALIP\s*.{1} Banco de dados IBORUNA[0-9\s\.]*", "")])
+    ]
 
-        # 6------------------------------------
+    __stages = [
         # remove 'Doc.:' and 'Inf.:' notations
-        raw_text = re.sub("Doc\.*:*", "\n", raw_text)
-        raw_text = re.sub("Inf\.*:*", "\n", raw_text)
-        raw_text = raw_text[1:]
+        ('6 speakers', True, [("Doc\.*:*", "\n"), ("Inf\.*:*", "\n"), __drop_first_char]),
 
-        # 7------------------------------------
         # remove the many notations indicating something was "unintelligible"
-        raw_text = re.sub("ininteligível", "", raw_text)
-        raw_text = re.sub("inint", "", raw_text)
-        raw_text = re.sub("inint\.", "", raw_text)
-
-        # 8------------------------------------
-        # normalize text and apply NFC
-        accents = ('COMBINING ACUTE ACCENT', 'COMBINING GRAVE ACCENT') #portuguese
-        chars = [c for c in unicodedata.normalize('NFD', raw_text) if c not in accents]
-        raw_text = unicodedata.normalize('NFC', ''.join(chars))# Strip accent
-
-        # 9-----------------------------------
-        # splits text in "...", "\n" and "– –". All of these, according to Alip's documentation, 
+        ('7 unintelligible', True, [("ininteligível", ""), ("inint", ""), ("inint\.", "")]),
+
+        ('8 accents', False, [__normalize]),
+
+        # splits text in "...", "\n" and "– –". All of these, according to Alip's documentation,
         # indicate moments in which there is a pause in the speakers speech
-        raw_text = re.sub("\.\.\.(?!\.)", "\n\n", raw_text) # no caso de 4 pontos seguidos, quebra no final
-        raw_text = re.sub("\s*\n\s*", "\n\n", raw_text)
-        raw_text = re.sub("\s*– –\s*", "\n\n", raw_text)
+        ('9 pauses', False, [("\.\.\.(?!\.)", "\n\n"), # no caso de 4 pontos seguidos, quebra no final
+                             ("\s*\n\s*", "\n\n"),
+                             ("\s*– –\s*", "\n\n")]),
 
-        # 10-----------------------------------
         # remove ((xxx))
-        raw_text = re.sub("\(\([a-z\s]*\)\)", "", raw_text)
+        ('10 comments', False, [("\(\([a-z\s]*\)\)", "")]),
 
-        # 11-----------------------------------
         # remove "::" (so it won't interfer with the formal notation convertion)
-        raw_text = re.sub(":", "", raw_text)
+        ('11 colons', False, [(":", "")]),
 
-        # 12-----------------------------------
-        # keep only informal notation
-        raw_text = self.__convert_to_speech_type('form', raw_text)
+        ('12 informal notation', False, [__keep_informal]),
 
-        # 13-----------------------------------
         # Remove any remaining trash
-        raw_text = re.sub("[^{}]".format(self.__case_sens_vocab), "", raw_text)
-        raw_text = re.sub("[ ]+", " ", raw_text)
+        ('13 trash', False, [__filter_vocab,
+                             ("[ ]+", " "),
+                             ("(?<![A-Z])\.", ""),
+                             ("\n[ ]+", "\n"),
+                             ("\n{3, 6}", "\n\n"),
+                             ("[ ]+", " ")]),
+
+        ('14 letters', False, [__expand_all_letters])
+    ]
+
+    __compiled_page_stages = compile_stages(__page_stages)
+    __compiled_stages = compile_stages(__stages)
+
+    # the pages are cut where a line break is followed by a lowercase letter: no marker, speaker code or
+    # header (as they are found in the pdfs) has one, so cleaning the text on each side of the cut gives the
+    # same result as cleaning it whole
+    __last_cut = re.compile('.*\n(?=[a-z])', re.S)
+    __lowercase = re.compile('[a-z]')
+
+
+    # receives: whether the time, number of substitutions and bytes before and after each stage of the
+    # cleanup are recorded (in "timings", see "clean_pages")
+    def __init__(self, instrument=False):
+
+        self.instrument = instrument
+        self.timings = []
+        self.num_of_pages = 0
+
+
+    # run_stages
+    # applies a table of compiled stages to a text, adding up the timings of each stage (see "clean_pages")
+    def __run_stages(self, stages, raw_text, sample_type):
+
+        for name, operations in stages:
+
+            if(self.instrument):
+                start_time = time.perf_counter()
+                bytes_in = len(raw_text.encode('utf-8'))
+                matches = 0
+
+            for operation in operations:
+                if(callable(operation)):
+                    raw_text = operation(self, raw_text, sample_type)
+                elif(self.instrument):
+                    raw_text, n = operation[0].subn(operation[1], raw_text)
+                    matches += n
+                else:
+                    raw_text = operation[0].sub(operation[1], raw_text)
+
+            if(self.instrument):
+                self.__record(name, time.perf_counter() - start_time, matches, bytes_in, len(raw_text.encode('utf-8')))
+
+        return raw_text
+
+
+    def __record(self, name, seconds, matches, bytes_in, bytes_out):
+
+        for timing in self.timings:
+            if(timing['stage'] == name):
+                timing['seconds'] += seconds
+                timing['matches'] += matches
+                timing['bytes_in'] += bytes_in
+                timing['bytes_out'] += bytes_out
+                return
+
+        self.timings.append({'stage': name, 'seconds': seconds, 'matches': matches, 'bytes_in': bytes_in,
+                             'bytes_out': bytes_out})
+
+
+    # clean_pages
+    # applies the cleanup stages to the text of the pages of a pdf, as the pages are given: the text is cut
+    # in pieces of a few pages (see "__last_cut"), the text before the beginning of the transcription is
+    # dropped and the page stages are applied to each piece. Only the cleaned pieces are joined, for the
+    # stages that need the whole text
+    # receives: an iterable of the texts of the pages (e.g. "extract_pages") and the type of the sample
+    # ('censo' or other)
+    # returns: the cleaned text, the same as cleaning the text of all the pages joined. The number of pages read
+    # is kept in "num_of_pages". If the converter is instrumented, "timings" gets a dict for each stage, with its
+    # name, time (seconds), number of substitutions (matches) and size of the text before and after it (bytes)
+    def clean_pages(self, pages, sample_type):
+
+        self.timings = []
+        self.num_of_pages = 0
+
+        begin_marker = self.__begin_marker(sample_type)
+        started = False
+        before = []     # the text before the beginning, only used if it is never found
+        cleaned = []
+        pending = []    # the pages after the last cut
+        last_char = ''
+
+        def clean_piece(piece):
+
+            nonlocal started
 
-        raw_text = re.sub("(?<![A-Z])\.", "", raw_text)
-        raw_text = re.sub("\n[ ]+", "\n", raw_text)
-        raw_text = re.sub("\n{3, 6}", "\n\n", raw_text)
-        raw_text = re.sub("[ ]+", " ", raw_text)
+            if(self.instrument):
+                start_time = time.perf_counter()
+                bytes_in = len(piece.encode('utf-8'))
 
-        # 14-----------------------------------
-        # Expand letters
-        raw_text = self.__expand_letters(raw_text)
+            piece, matches = begin_marker.subn("$$$", piece)
+            if(not started):
+                transcript_start_index = piece.find('$$$')
+                if(transcript_start_index == -1):
+                    before.append(piece)
+                    piece = ''
+                else:
+                    started = True
+                    before.clear()
+                    piece = piece[transcript_start_index+3:]
 
-        output_name = output_dir + '/' + filePath.split('/')[-1].split('.')[0].replace('TRANS', 'SPLITED') + '.txt'
+            if(self.instrument):
+                self.__record('2 begin marker', time.perf_counter() - start_time, matches, bytes_in,
+                              len(piece.encode('utf-8')))
+
+            if(len(piece) > 0):
+                cleaned.append(self.__run_stages(self.__compiled_page_stages, piece, sample_type))
+
+        for page in pages:
+
+            self.num_of_pages += 1
+            if(len(page) == 0):
+                continue
+
+            cut = self.__last_cut.match(page)
+            if(cut != None):
+                clean_piece(''.join(pending) + page[:cut.end()])
+                pending = [page[cut.end():]]
+            elif(last_char == '\n' and self.__lowercase.match(page)):
+                clean_piece(''.join(pending))
+                pending = [page]
+            else:
+                pending.append(page)
+            last_char = page[-1]
+
+        clean_piece(''.join(pending))
+
+        # without a beginning, the transcription starts at the third char (as in the first versions of the script)
+        if(not started):
+            cleaned.append(self.__run_stages(self.__compiled_page_stages, ''.join(before)[2:], sample_type))
+
+        return self.__run_stages(self.__compiled_stages, ''.join(cleaned), sample_type)
+
+
+    # clean_transcript
+    # applies the cleanup stages to the text extracted from a pdf (see "clean_pages")
+    # receives: the text and the type of the sample ('censo' or other)
+    # returns: the cleaned text
+    def clean_transcript(self, raw_text, sample_type):
+
+        return self.clean_pages([raw_text], sample_type)
+
+
+    # output_name
+    # returns: the path of the txt file generated from a pdf file in the output directory
+    def output_name(self, filePath, output_dir):
+
+        return output_dir + '/' + filePath.split('/')[-1].split('.')[0].replace('TRANS', 'SPLITED') + '.txt'
+
+
+    # convert_transcript
+    # converts a pdf transcription to a txt file in the output directory (see "output_name")
+    # receives: the path of the pdf file, the output directory, the type of the sample ('censo' or other) and,
+    # optionally, a page cache (see "pdf_page_cache") where the text of the pdf is read from (or saved to, the
+    # first time), and the sha256 of the pdf, if it is already known
+    # returns: the number of pages of the pdf file
+    def convert_transcript(self, filePath, output_dir, sample_type, cache=None, sha256=None):
+
+        # 1 to 14------------------------------
+        # the pages are extracted one at a time, and cleaned as they are extracted
+        if(cache != None):
+            pages = cache.pages(filePath, sha256)
+        else:
+            pages = extract_pages(filePath)
+
+        with contextlib.closing(pages):
+            raw_text = self.clean_pages(pages, sample_type)
+
+        output_name = self.output_name(filePath, output_dir)
 
         # 15------------------------------------
         # Write file
         with open(output_name, 'w') as f:
             f.write(raw_text)
+
+        return self.num_of_pages
+
+
+
+# extract_pages
+# receives: the path of a pdf file
+# returns: a generator of the text of each page, extracted as the pages are read. The file is closed when all
+# the pages have been read or the generator is closed
+def extract_pages(filePath):
+
+    with open(filePath, 'rb') as pdfFileObj:
+
+        # "PdfReader" replaced "PdfFileReader" in PyPDF2 2.0 (and the old one was removed in 3.0)
+        if(hasattr(PyPDF2, 'PdfReader')):
+            for pageObj in PyPDF2.PdfReader(pdfFileObj).pages:
+                yield pageObj.extract_text()
+        else:
+            pdfReader = PyPDF2.PdfFileReader(pdfFileObj)
+            for page in range(pdfReader.getNumPages()):
+                yield pdfReader.getPage(page).extractText()
+
+
+
+# version of the conversion rules: the hash of this script, so any change in the rules makes every
+# transcription out of date
+converter_version = file_hash(os.path.abspath(__file__))
+
+# version of the text extraction (see "extract_pages"), the key of the extracted text in the page cache along
+# with the hash of the pdf. The last number must be increased whenever "extract_pages" changes
+extractor_version = 'PyPDF2-' + PyPDF2.__version__ + '-1'
+
+
+
+# convert_one
+# converts a single pdf file, never raising an error (to be run by the processes of "convert_transcripts")
+# returns: a dict with the status ('converted' or 'failed'), number of pages, wall time and error of the conversion,
+# whether its text was found in the page cache ('hit', 'miss', or None without a cache) and, if "instrument" is
+# True, the timings of each stage of the cleanup (see "clean_pages")
+def convert_one(filePath, output_dir, sample_type, instrument=False, cache_dir=None, cache_size=default_max_bytes,
+                sha256=None):
+
+    start_time = time.perf_counter()
+    entry = {'status': 'converted', 'pages': None, 'seconds': None, 'error': None, 'cache': None, 'sha256': sha256}
+
+    converter = AlipTranscriptConverter(instrument)
+    cache = None
+    try:
+        # the hash is the key of the page cache, and is kept in the manifest for the 'hash' mode of the next runs
+        if(sha256 == None):
+            sha256 = entry['sha256'] = file_hash(filePath)
+        if(cache_dir != None):
+            cache = PageTextCache(cache_dir, extract_pages, extractor_version, cache_size)
+        entry['pages'] = converter.convert_transcript(filePath, output_dir, sample_type, cache, sha256)
+    except Exception as e:
+        entry['status'] = 'failed'
+        entry['error'] = type(e).__name__ + ': ' + str(e)
+
+    if(cache != None):
+        entry['cache'] = 'hit' if cache.hits > 0 else 'miss'
+
+    entry['seconds'] = time.perf_counter() - start_time
+    if(instrument):
+        entry['stages'] = converter.timings
+
+    return entry
+
+
+
+# convert_transcripts
+# converts many pdf transcriptions, "workers" at a time, in separate processes
+# receives: a directory (all its pdf files are converted) or a glob pattern (e.g. "alip/*TRANS*.pdf"), the output
+# directory, the type of the samples, the number of processes and how to find the outputs that are already up to
+# date, and don't need to be converted again:
+#   'mtime' - the txt file is newer than both the pdf file and this script
+#   'hash'  - the manifest of the last run has the same hash of the pdf file and of this script
+#   None    - every file is converted
+# writes "manifest.json" in the output directory, with the status ('converted', 'skipped' or 'failed'),
+# number of pages, wall time and hash of each pdf file. If "instrument" is True, the manifest also has the
+# total time, substitutions and bytes removed by each stage of the cleanup, over all the files converted
+# If "cache_dir" is given, the text extracted from the pdfs is kept in a page cache of at most "cache_size" bytes
+# (see "pdf_page_cache"), so the pdfs are only parsed once: when only the cleanup changes, the transcriptions are
+# converted again from the cached text
+# returns: the manifest
+def convert_transcripts(source, output_dir, sample_type, workers=os.cpu_count(), skip='mtime', instrument=False,
+                        cache_dir=None, cache_size=default_max_bytes):
+
+    if(skip not in ('mtime', 'hash', None)):
+        raise NameError('Error in \'convert_transcripts\', skip must be \'mtime\', \'hash\' or None')
+
+    if(os.path.isdir(source)):
+        filePaths = sorted(glob.glob(os.path.join(source, '*.pdf')) + glob.glob(os.path.join(source, '*.PDF')))
+    else:
+        filePaths = sorted(glob.glob(source))
+
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    manifest_name = output_dir + '/manifest.json'
+    previous = {}
+    if(os.path.exists(manifest_name)):
+        with open(manifest_name, 'r') as f:
+            previous = json.load(f)
+
+    # the cache may have been given a smaller size than the last time
+    if(cache_dir != None):
+        PageTextCache(cache_dir, extract_pages, extractor_version, cache_size).evict()
+
+    start_time = time.perf_counter()
+    converter = AlipTranscriptConverter()
+    script_mtime = os.path.getmtime(os.path.abspath(__file__))
+
+    # finds the files that are already up to date (the pdfs are only hashed here in the 'hash' mode, the other
+    # ones are hashed by the workers, when they are converted)
+    files = {}
+    pending = []
+    for filePath in filePaths:
+
+        entry = {'status': None, 'pages': None, 'seconds': None, 'error': None, 'sha256': None,
+                 'output': converter.output_name(filePath, output_dir)}
+        last = previous.get('files', {}).get(filePath, {})
+        if(skip == 'hash'):
+            entry['sha256'] = file_hash(filePath)
+
+        if(skip == 'mtime'):
+            up_to_date = (os.path.exists(entry['output']) and
+                          os.path.getmtime(entry['output']) >= max(os.path.getmtime(filePath), script_mtime))
+        elif(skip == 'hash'):
+            up_to_date = (os.path.exists(entry['output']) and previous.get('converter') == converter_version and
+                          last.get('sha256') == entry['sha256'] and last.get('status') in ('converted', 'skipped'))
+        else:
+            up_to_date = False
+
+        if(up_to_date):
+            entry['status'] = 'skipped'
+            entry['pages'] = last.get('pages')
+            # the pdf hasn't changed since the last run, so its hash is still the same
+            if(entry['sha256'] == None):
+                entry['sha256'] = last.get('sha256')
+        else:
+            pending.append(filePath)
+
+        files[filePath] = entry
+
+    print(str(len(filePaths)) + ' pdf files, ' + str(len(pending)) + ' to be converted')
+
+    # converts the other ones, reporting each file as it is finished
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(convert_one, filePath, output_dir, sample_type, instrument, cache_dir, cache_size,
+                               files[filePath]['sha256']): filePath for filePath in pending}
+
+        for done, future in enumerate(concurrent.futures.as_completed(futures)):
+            filePath = futures[future]
+            files[filePath].update(future.result())
+            print(str(done + 1) + ' of ' + str(len(pending)) + ': ' + filePath + ' ' + files[filePath]['status'])
+
+    manifest = {
+        'converter': converter_version,
+        'sample_type': sample_type,
+        'seconds': time.perf_counter() - start_time,
+        'files': files
+    }
+
+    # adds up the timings of each stage over all the files, so the stages that dominate the cleanup can be seen
+    if(instrument):
+        stages = {}
+        for entry in files.values():
+            for timing in entry.pop('stages', []):
+                stage = stages.setdefault(timing['stage'], {'seconds': 0, 'matches': 0, 'bytes_removed': 0})
+                stage['seconds'] += timing['seconds']
+                stage['matches'] += timing['matches']
+                stage['bytes_removed'] += timing['bytes_in'] - timing['bytes_out']
+        manifest['stages'] = stages
+
+    # the manifest is written to a temporary file first, so an interrupted run never leaves a broken one
+    with open(manifest_name + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=4, ensure_ascii=False)
+    os.replace(manifest_name + '.tmp', manifest_name)
+
+    failed = [filePath for filePath in filePaths if files[filePath]['status'] == 'failed']
+    print(str(len(failed)) + ' failed')
+
+    return manifest
+
+
+
+
+
+# Main code-------------------------------------------------------
+# usage: python treat_alip_transcriptions.py <directory or glob of pdf files> <output directory> [sample type]
+# [page cache directory]
+if __name__ == '__main__':
+    convert_transcripts(sys.argv[1], sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else 'censo',
+                        cache_dir=sys.argv[4] if len(sys.argv) > 4 else None)
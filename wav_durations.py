@@ -0,0 +1,113 @@
+import concurrent.futures
+import itertools
+import os
+import struct
+
+
+# This script was originaly created as part of the works on the creation of the CORAA dataset,
+# created to assist the training of portuguese automatic speech recognition tools
+
+# This script gets the duration of wav files directly from their RIFF headers (the "fmt " and "data" chunks),
+# without decoding any sample, so durations can be computed at the speed the disk gives file metadata.
+# Many files are read at once by a pool of threads, either from a list of paths or from a whole directory
+# tree, such as the "wavs/<sub-dataset>/" layout of the CORAA export
+
+
+
+# read_wav_duration
+# RECEIVES: the path of a wav file
+# RETURNS: its duration in seconds
+def read_wav_duration(path):
+
+    with open(path, 'rb') as f:
+
+        riff, _, wave = struct.unpack('<4sI4s', f.read(12))
+        if(riff != b'RIFF' or wave != b'WAVE'):
+            raise RuntimeError('File \"' + path + '\" is not a RIFF/WAVE file')
+
+        byte_rate = None
+
+        # goes through the chunks until the "data" one, skipping the content of all the others
+        while True:
+            header = f.read(8)
+            if(len(header) < 8):
+                raise RuntimeError('File \"' + path + '\" has no data chunk')
+
+            chunk_id, chunk_size = struct.unpack('<4sI', header)
+
+            if(chunk_id == b'fmt '):
+                fmt = f.read(chunk_size)
+                byte_rate = struct.unpack('<I', fmt[8:12])[0]
+                remaining = chunk_size % 2
+            elif(chunk_id == b'data'):
+                break
+            else:
+                remaining = chunk_size + chunk_size % 2   # chunks are padded to an even size
+
+            f.seek(remaining, os.SEEK_CUR)
+
+        if(byte_rate == None or byte_rate == 0):
+            raise RuntimeError('File \"' + path + '\" has no valid fmt chunk before its data')
+
+        # streaming writers may leave the data size unset, in which case the data goes to the end of the file
+        available = os.fstat(f.fileno()).st_size - f.tell()
+        if(chunk_size == 0 or chunk_size == 0xFFFFFFFF or chunk_size > available):
+            chunk_size = available
+
+    return chunk_size / byte_rate
+
+
+
+# read_wav_durations
+# Reads the duration of many wav files, "workers" files at a time
+# RECEIVES: an iterable of paths of wav files, the number of threads and how many paths are handed to
+# the threads at a time (so very long iterables are never fully held in memory)
+# RETURNS: a dict where the key is the path and the value is the duration in seconds, a list of the
+# paths that don't exist and a list of (path, error) of the files that couldn't be read
+def read_wav_durations(paths, workers=16, batch_size=10000):
+
+    durations = {}
+    missing = []
+    errored = []
+
+    def read(path):
+        try:
+            return path, read_wav_duration(path), None
+        except FileNotFoundError:
+            return path, None, None
+        except Exception as e:
+            return path, None, str(e)
+
+    paths = iter(paths)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            batch = list(itertools.islice(paths, batch_size))
+            if(len(batch) == 0):
+                break
+
+            for path, duration, error in pool.map(read, batch):
+                if(duration != None):
+                    durations[path] = duration
+                elif(error != None):
+                    errored.append((path, error))
+                else:
+                    missing.append(path)
+
+    return durations, missing, errored
+
+
+
+# scan_wav_durations
+# Reads the duration of every wav file under a directory
+# RECEIVES: the directory to be scanned and the number of threads
+# RETURNS: the same as "read_wav_durations", with paths starting with the given directory
+def scan_wav_durations(root, workers=16):
+
+    def walk():
+        for directory, _, files in os.walk(root):
+            for name in files:
+                if(name.lower().endswith('.wav')):
+                    yield os.path.join(directory, name)
+
+    return read_wav_durations(walk(), workers)